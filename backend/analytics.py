@@ -0,0 +1,210 @@
+# backend/analytics.py
+"""Сводная статистика улова и экономики.
+
+Rollups слушает шину событий игры (EventBus.listen) и на каждое событие
+обновляет несколько счётчиков: ничего не перебирает и ничего не хранит
+поштучно. Статистика держится по часам в кольце из STATS_RETENTION_HOURS
+ячеек плюс общий итог за всё время, поэтому её размер не растёт ни с
+числом игроков, ни с числом забросов.
+
+События (user_id, event, data):
+    catch        {"casts": n, "fish": [[вид, вес, количество], ...]}
+    minted       {"source": "sell" | ..., "amount": рубли} - деньги вошли в экономику
+    sunk         {"sink": "worms" | ..., "amount": рубли} - деньги ушли из экономики
+    achievement  {"id": id достижения}
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+STATS_RETENTION_HOURS = int(os.environ.get("STATS_RETENTION_HOURS", "168"))  # неделя по часам
+WEIGHT_BUCKETS = (0, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)  # нижние границы корзин веса, кг
+
+
+class Rollup:
+    """Счётчики одного часа (или всего времени)"""
+
+    __slots__ = ("hour", "casts", "catches", "minted", "sunk", "species", "achievements")
+
+    def __init__(self, hour=None):
+        self.hour = hour
+        self.casts = 0
+        self.catches = 0
+        self.minted = {}  # источник -> рубли
+        self.sunk = {}  # статья расходов -> рубли
+        self.species = {}  # вид -> {"count", "weight", "max", "histogram"}
+        self.achievements = {}  # id -> открытий
+
+    def add_catch(self, species, weight, times):
+        stats = self.species.get(species)
+        if stats is None:
+            stats = self.species[species] = {"count": 0, "weight": 0.0, "max": 0.0, "histogram": [0] * len(WEIGHT_BUCKETS)}
+        stats["count"] += times
+        stats["weight"] = round(stats["weight"] + weight * times, 2)
+        stats["max"] = max(stats["max"], weight)
+        stats["histogram"][max(bisect.bisect_right(WEIGHT_BUCKETS, weight) - 1, 0)] += times
+        self.catches += times
+
+    def to_dict(self):
+        return {
+            "casts": self.casts,
+            "catches": self.catches,
+            "minted": dict(self.minted),
+            "sunk": dict(self.sunk),
+            "species": {name: dict(stats, histogram=list(stats["histogram"])) for name, stats in self.species.items()},
+            "achievements": dict(self.achievements),
+        }
+
+    @classmethod
+    def from_dict(cls, data, hour=None):
+        rollup = cls(hour)
+        rollup.casts = data.get("casts", 0)
+        rollup.catches = data.get("catches", 0)
+        rollup.minted = dict(data.get("minted", {}))
+        rollup.sunk = dict(data.get("sunk", {}))
+        for name, stats in data.get("species", {}).items():
+            histogram = list(stats["histogram"])[:len(WEIGHT_BUCKETS)]
+            # Старый файл с другим числом корзин: недостающие - пустые
+            stats = dict(stats, histogram=histogram + [0] * (len(WEIGHT_BUCKETS) - len(histogram)))
+            rollup.species[name] = stats
+        rollup.achievements = dict(data.get("achievements", {}))
+        return rollup
+
+
+class Rollups:
+    """Часовые и общие итоги событий игры"""
+
+    def __init__(self, retention_hours=STATS_RETENTION_HOURS, clock=time.time):
+        self.retention_hours = retention_hours
+        self.clock = clock
+        self.total = Rollup()
+        self._hours = [None] * retention_hours  # кольцо: час % retention_hours -> Rollup
+        self._lock = threading.Lock()
+
+    def _current(self, hour):
+        slot = hour % self.retention_hours
+        rollup = self._hours[slot]
+        if rollup is None or rollup.hour != hour:
+            # Ячейка неделю назад - переиспользуем под текущий час
+            rollup = self._hours[slot] = Rollup(hour)
+        return rollup
+
+    def handle(self, user_id, event, data):
+        """Обработчик шины событий"""
+        hour = int(self.clock() // 3600)
+        with self._lock:
+            current = self._current(hour)
+            for rollup in (current, self.total):
+                if event == "catch":
+                    rollup.casts += data["casts"]
+                    for species, weight, times in data["fish"]:
+                        rollup.add_catch(species, weight, times)
+                elif event == "minted":
+                    rollup.minted[data["source"]] = rollup.minted.get(data["source"], 0) + data["amount"]
+                elif event == "sunk":
+                    rollup.sunk[data["sink"]] = rollup.sunk.get(data["sink"], 0) + data["amount"]
+                elif event == "achievement":
+                    rollup.achievements[data["id"]] = rollup.achievements.get(data["id"], 0) + 1
+
+    def report(self, hours=24):
+        """Итоги за последние hours часов, по часам и за всё время"""
+        hours = max(1, min(int(hours), self.retention_hours))
+        now = int(self.clock() // 3600)
+        window = Rollup()
+        hourly = {}
+        with self._lock:
+            for rollup in self._hours:
+                if rollup is None or not now - hours < rollup.hour <= now:
+                    continue
+                merge(window, rollup)
+                hourly[_hour_label(rollup.hour)] = {
+                    "casts": rollup.casts,
+                    "catches": rollup.catches,
+                    "minted": sum(rollup.minted.values()),
+                    "sunk": sum(rollup.sunk.values()),
+                }
+            all_time = self.total.to_dict()
+        return {
+            "buckets": list(WEIGHT_BUCKETS),
+            "window_hours": hours,
+            "window": window.to_dict(),
+            "hourly": dict(sorted(hourly.items())),
+            "all_time": all_time,
+        }
+
+    def save(self, path):
+        with self._lock:
+            data = {
+                "total": self.total.to_dict(),
+                "hours": {str(rollup.hour): rollup.to_dict() for rollup in self._hours if rollup is not None},
+            }
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Ошибка сохранения статистики: {e}")
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = int(self.clock() // 3600)
+            with self._lock:
+                self.total = Rollup.from_dict(data.get("total", {}))
+                for hour, rollup in data.get("hours", {}).items():
+                    hour = int(hour)
+                    if now - self.retention_hours < hour <= now:
+                        self._hours[hour % self.retention_hours] = Rollup.from_dict(rollup, hour)
+        except Exception as e:
+            print(f"Ошибка загрузки статистики: {e}")
+
+
+def _hour_label(hour):
+    return datetime.fromtimestamp(hour * 3600).strftime("%Y-%m-%dT%H:00")
+
+
+def merge(target, source):
+    """Добавить счётчики source к target (Rollup)"""
+    target.casts += source.casts
+    target.catches += source.catches
+    for name, amount in source.minted.items():
+        target.minted[name] = target.minted.get(name, 0) + amount
+    for name, amount in source.sunk.items():
+        target.sunk[name] = target.sunk.get(name, 0) + amount
+    for name, stats in source.species.items():
+        mine = target.species.get(name)
+        if mine is None:
+            target.species[name] = dict(stats, histogram=list(stats["histogram"]))
+            continue
+        mine["count"] += stats["count"]
+        mine["weight"] = round(mine["weight"] + stats["weight"], 2)
+        mine["max"] = max(mine["max"], stats["max"])
+        mine["histogram"] = [a + b for a, b in zip(mine["histogram"], stats["histogram"])]
+    for name, count in source.achievements.items():
+        target.achievements[name] = target.achievements.get(name, 0) + count
+
+
+def merge_reports(reports):
+    """Общий отчёт из отчётов шардов (у всех одинаковые окно и корзины)"""
+    window, all_time, hourly = Rollup(), Rollup(), {}
+    for report in reports:
+        merge(window, Rollup.from_dict(report["window"]))
+        merge(all_time, Rollup.from_dict(report["all_time"]))
+        for label, counts in report["hourly"].items():
+            totals = hourly.setdefault(label, {"casts": 0, "catches": 0, "minted": 0, "sunk": 0})
+            for key, value in counts.items():
+                totals[key] += value
+    return {
+        "buckets": list(WEIGHT_BUCKETS),
+        "window_hours": reports[0]["window_hours"] if reports else 0,
+        "window": window.to_dict(),
+        "hourly": dict(sorted(hourly.items())),
+        "all_time": all_time.to_dict(),
+    }
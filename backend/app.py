@@ -1,8 +1,14 @@
 # backend/app.py (ПОЛНАЯ ВЕРСИЯ)
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory
 from flask_cors import CORS
-from game_logic import game_instance
+from events import format_sse
+from game_logic import REPLICA_MAX_STALENESS, REPLICA_OF, STATE_SECTIONS, game_instance
+from http_cache import CachedResponse
+from metrics import REQUEST_SECONDS, registry
 import os
+import signal
+import sys
+import time
 
 app = Flask(__name__)
 CORS(app, resources={
@@ -15,6 +21,57 @@ CORS(app, resources={
     }
 })
 
+# Каталоги магазина и достижений не меняются до перезапуска -
+# сериализуем и сжимаем их один раз
+shop_items_response = CachedResponse(app, {"items": game_instance.get_shop_items()})
+all_achievements_response = CachedResponse(app, {"all_achievements": game_instance.get_achievements()})
+
+# Метрики, которые считаются в момент чтения /api/metrics
+registry.gauge("fishing_users", "Игроки в памяти", lambda: game_instance.stats()["resident"])
+registry.gauge("fishing_players", "Все игроки", lambda: game_instance.count_users())
+registry.gauge("fishing_dirty_users", "Игроки, ждущие группового сохранения", lambda: game_instance.stats()["dirty"])
+registry.gauge("fishing_stream_subscribers", "Открытые подписки /api/stream", lambda: game_instance.events.subscriber_count())
+if REPLICA_OF:
+    registry.gauge("fishing_replica_staleness_seconds", "Отставание реплики от основного процесса",
+                   lambda: game_instance.staleness() or 0)
+
+# На реплике: события и аналитика живут только в основном процессе
+PRIMARY_ONLY_PATHS = ('/api/stream', '/api/stats')
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def replica_guard():
+    """Реплика отвечает только на чтения и только пока отстаёт не больше REPLICA_MAX_STALENESS"""
+    if not REPLICA_OF or not request.path.startswith('/api/') or request.method == 'OPTIONS':
+        return None
+    if request.path in ('/api/health', '/api/metrics'):
+        return None
+    if request.method != 'GET' or request.path in PRIMARY_ONLY_PATHS:
+        return jsonify({"error": "Read-only replica"}), 503
+    staleness = game_instance.staleness()
+    if staleness is None or staleness > REPLICA_MAX_STALENESS:
+        return jsonify({"error": "Replica is stale", "staleness": staleness}), 503
+    return None
+
+@app.after_request
+def report_staleness(response):
+    if REPLICA_OF:
+        staleness = game_instance.staleness()
+        response.headers['X-Replica-Staleness'] = 'unknown' if staleness is None else f"{staleness:.3f}"
+    return response
+
+@app.after_request
+def record_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Метка - шаблон маршрута, а не URL, чтобы число рядов было ограничено
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, response.status_code)
+    return response
+
 # Создаем папку для фронтенда если её нет
 if not os.path.exists('../frontend'):
     os.makedirs('../frontend')
@@ -37,16 +94,68 @@ def init_user():
 @app.route('/api/game/state', methods=['GET'])
 def get_game_state():
     user_id = request.args.get('user_id')
-    state = game_instance.get_user_state(user_id)
+    # fields=user,podsak - только нужные секции; since=<version> - только изменившиеся
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = [field for field in fields.split(',') if field]
+        if any(field not in STATE_SECTIONS for field in fields):
+            return jsonify({"error": "Unknown field"}), 400
+    since = request.args.get('since', type=int)
+    if since is None and request.args.get('since'):
+        return jsonify({"error": "Invalid since"}), 400
+    state = game_instance.get_user_state(user_id, fields, since)
     if state is None:
         return jsonify({"error": "User not found"}), 404
+    if since is not None and len(state) == 1:
+        # С версии since ничего не изменилось
+        return '', 304
     return jsonify(state)
 
+# Как часто в молчащий поток уходит комментарий, чтобы прокси не рвали соединение
+SSE_KEEPALIVE = float(os.environ.get("SSE_KEEPALIVE", "15"))
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """Поток событий игрока (server-sent events)"""
+    user_id = request.args.get('user_id')
+    if user_id is None or game_instance.get_user_state(user_id, []) is None:
+        return jsonify({"error": "User not found"}), 404
+    subscription = game_instance.events.subscribe(str(user_id))
+    if subscription is None:
+        return jsonify({"error": "Too many subscribers"}), 503
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while not subscription.closed:
+                messages = subscription.drain(SSE_KEEPALIVE)
+                if not messages:
+                    yield ": keepalive\n\n"
+                for message in messages:
+                    yield format_sse(message)
+        finally:
+            game_instance.events.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 @app.route('/api/game/fish', methods=['POST'])
 def fish():
     data = request.json
     user_id = data.get('user_id')
-    result = game_instance.fish(user_id)
+    result = game_instance.fish(user_id, data.get('spot'))
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/api/game/fish_batch', methods=['POST'])
+def fish_batch():
+    data = request.json
+    user_id = data.get('user_id')
+    count = data.get('count', 1)
+    result = game_instance.fish_batch(user_id, count, data.get('spot'))
     if 'error' in result:
         return jsonify(result), 400
     return jsonify(result)
@@ -79,10 +188,51 @@ def sell_fish_from_podsak():
         return jsonify(result), 400
     return jsonify(result)
 
+@app.route('/api/game/sell_bulk', methods=['POST'])
+def sell_bulk():
+    data = request.json
+    user_id = data.get('user_id')
+    result = game_instance.sell_bulk(
+        user_id,
+        fish_ids=data.get('fish_ids'),
+        species=data.get('species'),
+        min_weight=data.get('min_weight'),
+        max_weight=data.get('max_weight'),
+        min_price=data.get('min_price'),
+        max_price=data.get('max_price'),
+        sell_all=data.get('all') is True
+    )
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/api/spots', methods=['GET'])
+def get_spots():
+    """Места рыбалки из каталога (каталог перечитывается без перезапуска)"""
+    return jsonify(game_instance.get_spots())
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Итоги улова и экономики: за окно в hours часов (по умолчанию сутки), по часам и за всё время"""
+    return jsonify(game_instance.get_stats(request.args.get('hours', 24, type=int)))
+
+@app.route('/api/loadouts', methods=['GET'])
+def get_loadouts():
+    """Лучшие наборы экипировки магазина по ожидаемому доходу"""
+    result = game_instance.get_loadouts(
+        request.args.get('spot'),
+        request.args.get('limit', 20, type=int),
+        request.args.get('sort', 'profit')
+    )
+    if result is None:
+        return jsonify({"error": "Loadouts are not ready"}), 503
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
 @app.route('/api/shop/items', methods=['GET'])
 def get_shop_items():
-    items = game_instance.get_shop_items()
-    return jsonify({"items": items})
+    return shop_items_response.serve(request)
 
 @app.route('/api/shop/buy', methods=['POST'])
 def buy_item():
@@ -133,12 +283,30 @@ def equip_item():
         return jsonify(result), 400
     return jsonify(result)
 
+@app.route('/api/batch', methods=['POST'])
+def run_batch():
+    """Несколько действий игрока за один запрос; в ответе - итоговое состояние"""
+    data = request.json
+    user_id = data.get('user_id')
+    result = game_instance.run_batch(user_id, data.get('operations'), atomic=data.get('atomic') is True)
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
 @app.route('/api/top', methods=['GET'])
 def get_top_players():
     limit = request.args.get('limit', 10, type=int)
     top_players = game_instance.get_top_players(limit)
     return jsonify({"top_players": top_players})
 
+@app.route('/api/top/me', methods=['GET'])
+def get_my_rank():
+    user_id = request.args.get('user_id')
+    result = game_instance.get_player_rank(user_id)
+    if 'error' in result:
+        return jsonify(result), 404
+    return jsonify(result)
+
 @app.route('/api/achievements', methods=['GET'])
 def get_achievements():
     user_id = request.args.get('user_id')
@@ -148,13 +316,12 @@ def get_achievements():
             return jsonify(achievements), 404
         return jsonify({"achievements": achievements})
     else:
-        achievements = game_instance.get_achievements()
-        return jsonify({"all_achievements": achievements})
+        return all_achievements_response.serve(request)
 
 @app.route('/api/user/inventory', methods=['GET'])
 def get_user_inventory():
     user_id = request.args.get('user_id')
-    state = game_instance.get_user_state(user_id)
+    state = game_instance.get_user_state(user_id, ["inventory"])
     if state is None:
         return jsonify({"error": "User not found"}), 404
     return jsonify({"inventory": state.get("inventory", [])})
@@ -162,7 +329,7 @@ def get_user_inventory():
 @app.route('/api/user/equipment', methods=['GET'])
 def get_user_equipment():
     user_id = request.args.get('user_id')
-    state = game_instance.get_user_state(user_id)
+    state = game_instance.get_user_state(user_id, ["equipped_items"])
     if state is None:
         return jsonify({"error": "User not found"}), 404
     return jsonify({"equipment": state.get("equipped_items", {})})
@@ -170,7 +337,7 @@ def get_user_equipment():
 @app.route('/api/user/podsak', methods=['GET'])
 def get_user_podsak():
     user_id = request.args.get('user_id')
-    state = game_instance.get_user_state(user_id)
+    state = game_instance.get_user_state(user_id, ["podsak"])
     if state is None:
         return jsonify({"error": "User not found"}), 404
     return jsonify({"podsak": state.get("podsak", [])})
@@ -178,12 +345,24 @@ def get_user_podsak():
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
+    if REPLICA_OF:
+        staleness = game_instance.staleness()
+        fresh = staleness is not None and staleness <= REPLICA_MAX_STALENESS
+        return jsonify({
+            "status": "healthy" if fresh else "stale",
+            "users_count": game_instance.count_users(),
+            "replica": {"staleness": staleness, "applied": game_instance.tailer.seq}
+        }), 200 if fresh else 503
     return jsonify({
         "status": "healthy",
-        "users_count": len(game_instance.users),
+        "users_count": game_instance.count_users(),
         "message": "Fishing Game API is running"
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -194,7 +373,9 @@ def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 if __name__ == '__main__':
+    # SIGTERM завершает процесс через atexit - накопленные изменения дописываются
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     print("🚀 Fishing Game API запущен на http://localhost:5000")
-    print("📊 Загружено пользователей:", len(game_instance.users))
+    print("📊 Пользователей:", game_instance.count_users())
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,270 @@
+# backend/backup.py
+"""Резервные копии игроков в NDJSON: полные и инкрементальные.
+
+Копия - каталог <корень>/<время создания>/ с кусками chunk-00000.ndjson
+(или .ndjson.gz) по BACKUP_CHUNK игроков и manifest.json, где у каждого
+куска записаны число игроков и sha256 файла. Строка куска - одна запись
+игрока в том же компактном виде, что строка журнала: {"id": ..., "user": {...}}.
+
+Выгрузка читает хранилище через Storage.iter_records - по одному игроку,
+без блокировок игры, поэтому её можно запускать рядом с работающим
+сервером. Инкрементальная копия берёт только игроков, у которых
+last_active не раньше отметки until предыдущей копии. Отметка ставится
+на BACKUP_OVERLAP секунд раньше начала выгрузки: изменения, ещё не
+дошедшие до диска через групповое сохранение, попадут в следующую копию.
+
+Загрузка проверяет контрольную сумму куска до того, как записать из него
+хоть одного игрока, и пишет в хранилище пачками. Загружать нужно в
+остановленный сервер (как migrate.py).
+
+    python backup.py export backups [--incremental] [--gzip]
+    python backup.py import backups/20261018T120000000000 [...]
+    python backup.py restore backups  # последняя полная копия и все инкрементальные после неё
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+from models import format_time, now_time, parse_time
+from storage import _dump_record, open_storage
+
+BACKUP_CHUNK = int(os.environ.get("BACKUP_CHUNK", "10000"))  # игроков в одном куске
+BACKUP_OVERLAP = float(os.environ.get("BACKUP_OVERLAP", "60"))  # секунды перекрытия соседних копий
+DEFAULT_PATHS = {"wal": "users.json", "sqlite": "users.db"}  # файлы хранилища игры по умолчанию
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+
+class BackupError(ValueError):
+    """Копия неполная, повреждена или не подходит для загрузки"""
+
+
+def list_manifests(root):
+    """Манифесты всех завершённых копий в корне, от старых к новым"""
+    manifests = []
+    if not os.path.isdir(root):
+        return manifests
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name, MANIFEST)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                manifests.append(dict(json.load(f), path=os.path.join(root, name)))
+    return manifests
+
+
+def export_backup(storage, root, incremental=False, compress=False, chunk_size=BACKUP_CHUNK):
+    """Выгрузить игроков хранилища в новую копию; возвращает её манифест"""
+    started = now_time()
+    since = base = None
+    if incremental:
+        previous = list_manifests(root)
+        if not previous:
+            raise BackupError(f"В {root} нет копии, от которой считать инкрементальную")
+        since, base = previous[-1]["until"], previous[-1]["name"]
+    since_time = parse_time(since)
+
+    name = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(root, name)
+    tmp_path = path + ".tmp"  # до переименования копия невидима для list_manifests
+    os.makedirs(tmp_path)
+
+    chunks = []
+    writer = None
+    total = 0
+    try:
+        for user_id, user in storage.iter_records():
+            if since_time is not None:
+                last_active = parse_time(user.get("last_active"))
+                # Без last_active - игрок не менялся с тех пор, как игра его ставит;
+                # время, которое не удалось разобрать, считаем изменением
+                if last_active is None or isinstance(last_active, int) and last_active < since_time:
+                    continue
+            if writer is None:
+                writer = _ChunkWriter(tmp_path, len(chunks), compress)
+            writer.write(_dump_record(user_id, user))
+            total += 1
+            if writer.records >= chunk_size:
+                chunks.append(writer.close())
+                writer = None
+        if writer is not None:
+            chunks.append(writer.close())
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "name": name,
+            "kind": "incremental" if incremental else "full",
+            "base": base,
+            "since": since,
+            "until": format_time(started - int(BACKUP_OVERLAP * 1_000_000)),
+            "created_at": format_time(started),
+            "records": total,
+            "compression": "gzip" if compress else None,
+            "chunks": chunks,
+        }
+        with open(os.path.join(tmp_path, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return manifest
+
+
+class _ChunkWriter:
+    """Один кусок копии: строки пишутся сразу в файл, sha256 считается по его байтам"""
+
+    def __init__(self, directory, number, compress):
+        self.file = f"chunk-{number:05d}.ndjson" + (".gz" if compress else "")
+        self.path = os.path.join(directory, self.file)
+        self.records = 0
+        self._raw = open(self.path, "wb")
+        self._hash = hashlib.sha256()
+        self._out = gzip.GzipFile(fileobj=_HashingFile(self._raw, self._hash), mode="wb") if compress else None
+
+    def write(self, line):
+        data = line.encode("utf-8") + b"\n"
+        if self._out is not None:
+            self._out.write(data)
+        else:
+            self._raw.write(data)
+            self._hash.update(data)
+        self.records += 1
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        return {"file": self.file, "records": self.records, "sha256": self._hash.hexdigest()}
+
+    def abort(self):
+        self._raw.close()
+
+
+class _HashingFile:
+    """Файл, который по ходу записи считает sha256 записанных байтов"""
+
+    def __init__(self, raw, digest):
+        self.raw = raw
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+def read_backup(path):
+    """(user_id, user) копии по порядку; кусок проверяется по sha256 перед чтением"""
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        raise BackupError(f"{path}: нет {MANIFEST} - копия не завершена")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise BackupError(f"{path}: неизвестный формат копии {manifest.get('format')}")
+
+    for chunk in manifest["chunks"]:
+        chunk_path = os.path.join(path, chunk["file"])
+        digest = hashlib.sha256()
+        with open(chunk_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        if digest.hexdigest() != chunk["sha256"]:
+            raise BackupError(f"{chunk_path}: контрольная сумма не совпадает")
+
+        records = 0
+        opener = gzip.open if manifest.get("compression") == "gzip" else open
+        with opener(chunk_path, "rb") as f:
+            for line in f:
+                record = json.loads(line)
+                records += 1
+                yield record["id"], record["user"]
+        if records != chunk["records"]:
+            raise BackupError(f"{chunk_path}: записей {records}, в манифесте {chunk['records']}")
+
+
+def restore_chain(root):
+    """Каталоги для восстановления: последняя полная копия и инкрементальные после неё"""
+    manifests = list_manifests(root)
+    fulls = [i for i, manifest in enumerate(manifests) if manifest["kind"] == "full"]
+    if not fulls:
+        raise BackupError(f"В {root} нет полной копии")
+    chain = manifests[fulls[-1]:]
+    for previous, manifest in zip(chain, chain[1:]):
+        if manifest["base"] != previous["name"]:
+            raise BackupError(f"Копия {manifest['name']} сделана от {manifest['base']}, а не от {previous['name']}")
+    return [manifest["path"] for manifest in chain]
+
+
+def import_backups(storage, paths, batch=BACKUP_CHUNK):
+    """Записать игроков копий в хранилище (более поздние копии перекрывают ранние)"""
+    total = 0
+    records = []
+    for path in paths:
+        for user_id, user in read_backup(path):
+            records.append((user_id, user))
+            if len(records) >= batch:
+                total += _write_batch(storage, records)
+                records = []
+    total += _write_batch(storage, records)
+    storage.checkpoint()
+    return total
+
+
+def _write_batch(storage, records):
+    if records and not storage.put_many(records):
+        raise BackupError(f"Не удалось записать {len(records)} игроков в хранилище")
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервные копии игроков в NDJSON")
+    parser.add_argument("--backend", choices=sorted(DEFAULT_PATHS),
+                        default=os.environ.get("STORAGE_BACKEND", "wal"))
+    parser.add_argument("--path", help="файл хранилища (по умолчанию - файл игры для бэкенда)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="выгрузить игроков в новую копию")
+    export.add_argument("root", help="каталог с копиями")
+    export.add_argument("--incremental", action="store_true", help="только изменившиеся после последней копии")
+    export.add_argument("--gzip", action="store_true", help="сжимать куски")
+    export.add_argument("--chunk", type=int, default=BACKUP_CHUNK, help="игроков в куске")
+    load = commands.add_parser("import", help="загрузить копии в хранилище по порядку")
+    load.add_argument("paths", nargs="+", help="каталоги копий")
+    restore = commands.add_parser("restore", help="восстановить хранилище из цепочки копий")
+    restore.add_argument("root", help="каталог с копиями")
+    args = parser.parse_args()
+
+    path = args.path or DEFAULT_PATHS[args.backend]
+    options = {"fsync_interval": 0} if args.backend == "wal" else {}
+    storage = open_storage(args.backend, path, **options)
+    try:
+        if args.command == "export":
+            manifest = export_backup(storage, args.root, args.incremental, args.gzip, args.chunk)
+            print(f"✅ Копия {manifest['name']} ({manifest['kind']}): игроков {manifest['records']}, "
+                  f"кусков {len(manifest['chunks'])}")
+            return
+
+        paths = restore_chain(args.root) if args.command == "restore" else args.paths
+        storage.open()
+        count = import_backups(storage, paths)
+        print(f"✅ Загружено записей: {count} из {len(paths)} копий -> {path}")
+    except BackupError as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+# backend/bench/__init__.py
+"""Бенчмарки игры.
+
+Запуск из каталога backend/:
+
+    python -m bench.micro --sizes 1000 10000 --out micro.json
+    python -m bench.load --requests 20000 --threads 8 --out load.json
+    python -m bench.compare baseline.json micro.json --tolerance 0.2
+
+Игра и её хранилище создаются во временном каталоге, настоящий users.json
+не трогается. Результаты пишутся в JSON, compare завершается с кодом 1,
+если какая-то метрика стала хуже больше чем на tolerance.
+"""
@@ -0,0 +1,127 @@
+# backend/bench/common.py
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_workdir():
+    """Перейти во временный каталог до импорта game_logic.
+
+    Игра открывает users.json и пишет stats.json в текущем каталоге -
+    бенчмарк не должен видеть и менять настоящие данные.
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    workdir = tempfile.mkdtemp(prefix="fishing-bench-")
+    os.chdir(workdir)
+    return workdir
+
+
+def synthetic_user(rng, index, catalog):
+    """Правдоподобный игрок: деньги, подсак, экипировка, достижения"""
+    from game_logic import SLOTS, achievements_list, fishes
+
+    catch = []
+    for _ in range(rng.randint(0, 20)):
+        fish = rng.choice(fishes)
+        weight = round(rng.uniform(fish["min_weight"], fish["max_weight"]), 2)
+        catch.append({
+            "name": fish["name"],
+            "weight": weight,
+            "price": int(weight * fish["price_per_kg"]),
+            "type": fish["type"],
+            "caught_at": "2025-01-01T12:00:00.000001",
+        })
+
+    items = {slot: None for slot in SLOTS}
+    for name, info in rng.sample(sorted(catalog.items()), 2):
+        items[info["type"]] = {"name": name, "durability": rng.randint(1, 500), "effect": info["effect"]}
+
+    return {
+        "name": f"Рыбак {index}",
+        "worms": rng.randint(0, 5000),
+        "money": int(rng.paretovariate(1.2) * 1000),
+        "catch": catch,
+        "last_catch": None,
+        "achievements": [ach["id"] for ach in rng.sample(achievements_list, rng.randint(0, 5))],
+        "bag_limit": 20,
+        "inventory": [],
+        "items": items,
+        "created_at": "2025-01-01T12:00:00.000001",
+        "last_active": "2025-01-01T12:00:00.000001",
+    }
+
+
+def write_store(path, size, seed=1):
+    """users.json из size синтетических игроков"""
+    from game_logic import all_items
+
+    rng = random.Random(seed)
+    users = {str(100000 + i): synthetic_user(rng, i, all_items) for i in range(size)}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(users, f, ensure_ascii=False, separators=(",", ":"))
+    return sorted(users)
+
+
+def make_game(size, seed=1, persist_mode="async"):
+    """FishingGame на синтетическом хранилище из size игроков"""
+    from game_logic import FishingGame
+    from storage import WalStorage
+
+    path = os.path.join(tempfile.mkdtemp(prefix="store-", dir=os.getcwd()), "users.json")
+    write_store(path, size, seed)
+    return FishingGame(WalStorage(path), persist_mode=persist_mode)
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    """Статистика по длительностям в секундах (в ответе - микросекунды)"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "runs": len(ordered),
+        "mean_us": round(total / len(ordered) * 1e6, 3) if ordered else 0.0,
+        "p50_us": round(percentile(ordered, 0.50) * 1e6, 3),
+        "p95_us": round(percentile(ordered, 0.95) * 1e6, 3),
+        "p99_us": round(percentile(ordered, 0.99) * 1e6, 3),
+    }
+
+
+def measure(fn, runs):
+    """Длительности runs вызовов fn"""
+    samples = []
+    clock = time.perf_counter
+    for _ in range(runs):
+        started = clock()
+        fn()
+        samples.append(clock() - started)
+    return samples
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+
+def write_results(path, results):
+    results = dict(results, environment=environment())
+    text = json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,55 @@
+# backend/bench/compare.py
+"""Сравнение результатов двух прогонов бенчмарков.
+
+    python -m bench.compare baseline.json current.json --tolerance 0.2
+
+Задержки (p50/p95) не должны вырасти, а пропускная способность - упасть
+больше чем на tolerance. Иначе код выхода 1.
+"""
+import argparse
+import json
+import sys
+
+LATENCY_KEYS = ("p50_us", "p95_us")
+
+
+def compare(baseline, current, tolerance):
+    """Список регрессий: (метрика, было, стало)"""
+    regressions = []
+    for name, stats in current.get("metrics", {}).items():
+        base = baseline.get("metrics", {}).get(name)
+        if base is None:
+            continue
+        for key in LATENCY_KEYS:
+            if base.get(key) and stats.get(key, 0) > base[key] * (1 + tolerance):
+                regressions.append((f"{name}.{key}", base[key], stats[key]))
+
+    base_rps = baseline.get("throughput_rps")
+    rps = current.get("throughput_rps")
+    if base_rps and rps is not None and rps < base_rps * (1 - tolerance):
+        regressions.append(("throughput_rps", base_rps, rps))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск регрессий между прогонами бенчмарков")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    regressions = compare(baseline, current, args.tolerance)
+    for metric, before, after in regressions:
+        print(f"Регрессия {metric}: {before} -> {after}")
+    if not regressions:
+        print("Регрессий нет")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# backend/bench/load.py
+"""Нагрузочный прогон API смесью действий игроков.
+
+По умолчанию запросы идут через тестовый клиент Flask в этом же процессе
+(игра поднимается на синтетическом хранилище); с --url - в запущенный сервер.
+Ответы не 2xx считаются ошибками: они попадают в errors, а не в задержки
+и пропускную способность.
+
+    python -m bench.load --users 10000 --requests 20000 --threads 8 --out load.json
+    python -m bench.load --url http://localhost:5000 --requests 5000
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from bench.common import make_game, prepare_workdir, summarize, write_results
+
+# Действие -> вес в смеси (примерно как играют живые игроки)
+DEFAULT_MIX = {
+    "fish": 45,
+    "keep": 10,
+    "sell": 10,
+    "sell_podsak": 5,
+    "buy_worms": 5,
+    "buy_item": 2,
+    "state": 23,
+}
+
+
+def shop_items(transport):
+    """Самый дешёвый предмет каждого слота магазина - его игроки чаще всего могут купить"""
+    cheapest = {}
+    for name, info in transport.get_json("/api/shop/items")["items"].items():
+        best = cheapest.get(info["type"])
+        if best is None or info["price"] < best[1]:
+            cheapest[info["type"]] = (name, info["price"])
+    return sorted(name for name, _ in cheapest.values())
+
+
+def request_for(action, user_id, rng, items):
+    """(метод, путь, тело) запроса для действия"""
+    if action == "fish":
+        return "POST", "/api/game/fish", {"user_id": user_id}
+    if action == "keep":
+        return "POST", "/api/game/keep", {"user_id": user_id}
+    if action == "sell":
+        return "POST", "/api/game/sell", {"user_id": user_id}
+    if action == "sell_podsak":
+        return "POST", "/api/game/sellfish", {"user_id": user_id, "fish_index": 0}
+    if action == "buy_worms":
+        return "POST", "/api/shop/buy_worms", {"user_id": user_id, "count": rng.randint(1, 50)}
+    if action == "buy_item":
+        return "POST", "/api/shop/buy", {"user_id": user_id, "item_name": rng.choice(items)}
+    return "GET", f"/api/game/state?user_id={user_id}", None
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def __call__(self, method, path, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        if method == "GET":
+            return client.get(path).status_code
+        return client.post(path, json=body).status_code
+
+    def get_json(self, path):
+        return self.app.test_client().get(path).get_json()
+
+
+class HttpTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def __call__(self, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def get_json(self, path):
+        with urllib.request.urlopen(self.base_url + path, timeout=30) as response:
+            return json.loads(response.read())
+
+
+def run_load(transport, user_ids, mix, requests, threads, seed):
+    actions = list(mix)
+    weights = [mix[action] for action in actions]
+    items = shop_items(transport)
+    per_thread = requests // threads
+    latencies = {action: [] for action in actions}  # только успешные ответы
+    errors = dict.fromkeys(actions, 0)
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        local = {action: [] for action in actions}
+        local_errors = dict.fromkeys(actions, 0)
+        local_statuses = {}
+        clock = time.perf_counter
+        for _ in range(per_thread):
+            action = rng.choices(actions, weights)[0]
+            method, path, body = request_for(action, rng.choice(user_ids), rng, items)
+            started = clock()
+            status = transport(method, path, body)
+            elapsed = clock() - started
+            if 200 <= status < 300:
+                local[action].append(elapsed)
+            else:
+                local_errors[action] += 1
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            for action, samples in local.items():
+                latencies[action].extend(samples)
+                errors[action] += local_errors[action]
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    everything = [sample for samples in latencies.values() for sample in samples]
+    total = len(everything) + sum(errors.values())
+    metrics = {"all": dict(summarize(everything), errors=sum(errors.values()))}
+    for action, samples in latencies.items():
+        if samples or errors[action]:
+            metrics[action] = dict(summarize(samples), errors=errors[action])
+    return {
+        "requests": total,
+        "errors": sum(errors.values()),
+        "error_rate": round(sum(errors.values()) / total, 4) if total else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(everything) / elapsed, 1) if elapsed else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "metrics": metrics,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон API")
+    parser.add_argument("--url", default=None, help="адрес запущенного сервера (иначе тестовый клиент)")
+    parser.add_argument("--users", type=int, default=10000, help="синтетических игроков (тестовый клиент)")
+    parser.add_argument("--user-id", action="append", default=[], help="игроки на сервере (для --url)")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--mix", default=None, help='JSON со смесью, например {"fish": 80, "state": 20}')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None, help="файл для JSON с результатами")
+    args = parser.parse_args()
+    out = os.path.abspath(args.out) if args.out else None
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+
+    if args.url:
+        if not args.user_id:
+            parser.error("для --url нужны игроки: --user-id ID (можно несколько)")
+        transport, user_ids = HttpTransport(args.url), args.user_id
+    else:
+        prepare_workdir()
+        import app as server
+
+        # Маршруты берут игру из модуля app - подменяем её синтетической
+        server.game_instance = make_game(args.users, args.seed)
+        user_ids = sorted(server.game_instance.users)
+        transport = TestClientTransport(server.app)
+
+    result = run_load(transport, user_ids, mix, args.requests, args.threads, args.seed)
+    write_results(out, dict(result, kind="load", mix=mix, threads=args.threads, target=args.url or "test_client"))
+
+
+if __name__ == "__main__":
+    main()
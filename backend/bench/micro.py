@@ -0,0 +1,62 @@
+# backend/bench/micro.py
+"""Микробенчмарки FishingGame на синтетических хранилищах.
+
+    python -m bench.micro --sizes 1000 10000 100000 --runs 2000 --out micro.json
+"""
+import argparse
+import itertools
+import os
+import random
+
+from bench.common import make_game, measure, prepare_workdir, summarize, write_results
+
+
+def bench_size(size, runs, seed, persist_mode):
+    from game_logic import ACHIEVEMENT_FISH_CAUGHT, fishes
+
+    game = make_game(size, seed, persist_mode)
+    user_ids = sorted(game.users)
+    for user in game.users.values():
+        user.worms = runs + 1
+
+    random.seed(seed)
+    users = itertools.cycle(user_ids)
+    players = itertools.cycle([game.users[user_id] for user_id in user_ids])
+    fish_dict = {"name": fishes[1]["name"], "weight": 3.5, "price": 525, "type": fishes[1]["type"]}
+
+    cases = {
+        "fish": (lambda: game.fish(next(users)), runs),
+        "generate_weight": (lambda: game._generate_weight(game.catalog.spot(), 0.05), runs * 10),
+        "check_achievements": (lambda: game._check_achievements(next(players), ACHIEVEMENT_FISH_CAUGHT, fish_dict), runs * 10),
+        "get_top_players_10": (lambda: game.get_top_players(10), runs),
+        "get_top_players_100": (lambda: game.get_top_players(100), max(runs // 10, 1)),
+        "save_users": (game.save_users, 3),
+    }
+
+    results = {}
+    for name, (fn, count) in cases.items():
+        results[f"{name}@{size}"] = summarize(measure(fn, count))
+        print(f"{name}@{size}: {results[f'{name}@{size}']['p50_us']} мкс (p50)")
+    game.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки игровой логики")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--persist", choices=["async", "sync"], default="async", help="режим сохранения игроков")
+    parser.add_argument("--out", default=None, help="файл для JSON с результатами")
+    args = parser.parse_args()
+    out = os.path.abspath(args.out) if args.out else None
+
+    prepare_workdir()
+    results = {}
+    for size in args.sizes:
+        results.update(bench_size(size, args.runs, args.seed, args.persist))
+    write_results(out, {"kind": "micro", "seed": args.seed, "persist": args.persist, "metrics": results})
+
+
+if __name__ == "__main__":
+    main()
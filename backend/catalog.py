@@ -0,0 +1,179 @@
+# backend/catalog.py
+"""Каталог рыб и мест рыбалки из catalog.json.
+
+Каталог компилируется при загрузке: у каждого вида заранее посчитаны
+параметры розыгрыша веса, у каждого места - таблица псевдонимов для выбора
+вида. Заброс стоит одинаково и для 3, и для 300 видов. Игра держит ссылку
+на скомпилированный каталог и подменяет её целиком при перезагрузке файла.
+"""
+import hashlib
+import json
+import os
+import random
+
+import simulator
+from models import fish_names
+
+
+class AliasTable:
+    """Выбор индекса по весам за O(1) - метод псевдонимов Уокера (вариант Воуза).
+
+    Каждая из n ячеек хранит порог и псевдоним: выпавшая ячейка отдаёт свой
+    индекс, если дробная часть случайного числа меньше порога, иначе - псевдоним.
+    """
+
+    __slots__ = ("size", "prob", "alias")
+
+    def __init__(self, weights):
+        size = len(weights)
+        total = float(sum(weights))
+        if not size or total <= 0 or min(weights) < 0:
+            raise ValueError("Веса таблицы должны быть неотрицательными и не все нулевыми")
+
+        scaled = [weight * size / total for weight in weights]
+        prob = [1.0] * size
+        alias = list(range(size))
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Остатки - погрешность округления, их ячейки целиком свои
+
+        self.size = size
+        self.prob = prob
+        self.alias = alias
+
+    def sample(self, rng=random):
+        point = rng.random() * self.size
+        index = int(point)
+        return index if point - index < self.prob[index] else self.alias[index]
+
+
+class Species:
+    """Вид рыбы с подготовленными параметрами розыгрыша веса"""
+
+    __slots__ = (
+        "type", "name", "min_weight", "max_weight", "span", "price_per_kg", "golden",
+        "trophy_chance", "trophy_scale", "trophy_cap", "name_id", "type_id", "data",
+    )
+
+    def __init__(self, data):
+        self.data = data
+        self.type = data["type"]
+        self.name = data["name"]
+        self.min_weight = float(data["min_weight"])
+        self.max_weight = float(data["max_weight"])
+        if self.max_weight < self.min_weight:
+            raise ValueError(f"У вида {self.name} max_weight меньше min_weight")
+        self.span = self.max_weight - self.min_weight
+        self.price_per_kg = data["price_per_kg"]
+        self.golden = bool(data.get("golden"))
+        trophy = data.get("trophy") or {}
+        self.trophy_chance = float(trophy.get("chance", 0.0))
+        self.trophy_scale = float(trophy.get("scale", 0.0))
+        self.trophy_cap = float(trophy.get("cap", 0.0))
+        self.name_id = fish_names.id(self.name)
+        self.type_id = fish_names.id(self.type)
+
+    def weight(self, rare_bonus=0.0, rng=random):
+        """Вес улова; у трофейных видов с шансом trophy_chance + бонус - хвост сверх max_weight"""
+        if self.trophy_chance and rng.random() < self.trophy_chance + rare_bonus:
+            tail = min(rng.expovariate(1) * self.trophy_scale, self.trophy_cap)
+            return round(self.max_weight + 0.01 + tail, 2)
+        return round(self.min_weight + self.span * rng.random(), 2)
+
+
+class Spot:
+    """Место рыбалки: шанс поклёвки и таблица видов.
+
+    Редкие виды задаются абсолютным шансом и входят в ту же таблицу, что и
+    обычные (их веса делят оставшуюся вероятность), поэтому выбор вида - это
+    всегда один розыгрыш.
+    """
+
+    def __init__(self, data, species, base_chance):
+        self.id = data["id"]
+        self.name = data.get("name", self.id)
+        self.base_chance = float(data.get("base_chance", base_chance))
+
+        weights = data.get("species") or {}
+        rare = data.get("rare") or {}
+        rare_total = sum(rare.values())
+        if not weights or rare_total >= 1.0:
+            raise ValueError(f"У места {self.id} нет обычных видов или шанс редких не меньше 1")
+        common_total = float(sum(weights.values()))
+
+        self.species = []
+        probabilities = []
+        for type_name, weight in weights.items():
+            self.species.append(_lookup(species, type_name, self.id))
+            probabilities.append((1.0 - rare_total) * weight / common_total)
+        for type_name, chance in rare.items():
+            self.species.append(_lookup(species, type_name, self.id))
+            probabilities.append(chance)
+        self.probabilities = probabilities
+        self.table = AliasTable(probabilities)
+        # Векторный розыгрыш длинных серий fish_batch (None без numpy)
+        self.simulator = simulator.CastSimulator(self) if simulator.available() else None
+
+    def sample(self, rng=random):
+        return self.species[self.table.sample(rng)]
+
+    def describe(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "species": [
+                {"name": species.name, "type": species.type, "chance": round(probability, 8)}
+                for species, probability in zip(self.species, self.probabilities)
+            ]
+        }
+
+
+def _lookup(species, type_name, spot_id):
+    try:
+        return species[type_name]
+    except KeyError:
+        raise ValueError(f"Место {spot_id}: неизвестный вид {type_name}") from None
+
+
+class Catalog:
+    """Скомпилированный каталог: виды по типу и места рыбалки"""
+
+    def __init__(self, data, mtime=None, digest=None):
+        self.mtime = mtime
+        self.digest = digest  # sha256 содержимого файла - ключ кешей, зависящих от каталога
+        self.base_chance = float(data.get("base_chance", 0.7))
+        self.species = {}
+        for item in data["species"]:
+            self.species[item["type"]] = Species(item)
+        self.spots = {}
+        for item in data["spots"]:
+            self.spots[item["id"]] = Spot(item, self.species, self.base_chance)
+        self.default_spot = data.get("default_spot") or next(iter(self.spots))
+        if self.default_spot not in self.spots:
+            raise ValueError(f"Место по умолчанию {self.default_spot} не описано")
+        # тип -> название вида (у старых рыб в подсаке есть только название)
+        self.type_names = {species.type: species.name for species in self.species.values()}
+
+    def spot(self, spot_id=None):
+        """Место по id (по умолчанию - основное) или None"""
+        return self.spots.get(spot_id if spot_id is not None else self.default_spot)
+
+    def describe(self):
+        return {
+            "default_spot": self.default_spot,
+            "spots": [spot.describe() for spot in self.spots.values()]
+        }
+
+
+def load_catalog(path):
+    """Чтение и компиляция каталога; ошибки в файле - ValueError/KeyError"""
+    mtime = os.stat(path).st_mtime_ns
+    with open(path, "rb") as f:
+        raw = f.read()
+    return Catalog(json.loads(raw.decode("utf-8")), mtime, hashlib.sha256(raw).hexdigest())
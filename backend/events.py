@@ -0,0 +1,117 @@
+# backend/events.py
+import itertools
+import json
+import os
+import threading
+from collections import deque
+
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "64"))  # событий в очереди одного подключения
+SSE_MAX_SUBSCRIBERS = int(os.environ.get("SSE_MAX_SUBSCRIBERS", "1000"))
+
+
+class Subscription:
+    """Очередь событий одного SSE-подключения.
+
+    Очередь ограничена: если клиент не успевает читать, накопленные события
+    выбрасываются и вместо них отдаётся одно событие resync - клиент
+    перечитывает состояние целиком.
+    """
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.closed = False
+        self._queue = deque()
+        self._ready = threading.Condition(threading.Lock())
+
+    def put(self, event):
+        with self._ready:
+            if len(self._queue) >= self.maxsize:
+                self.dropped += len(self._queue)
+                self._queue.clear()
+                self._queue.append({"id": event["id"], "event": "resync", "data": {}})
+            elif self._queue and self._queue[-1]["event"] == "resync":
+                self.dropped += 1
+            else:
+                self._queue.append(event)
+            self._ready.notify()
+
+    def drain(self, timeout):
+        """Все накопленные события; ждёт не дольше timeout секунд"""
+        with self._ready:
+            if not self._queue and not self.closed:
+                self._ready.wait(timeout)
+            events = list(self._queue)
+            self._queue.clear()
+            return events
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+
+
+class EventBus:
+    """Рассылка событий игроков подписчикам (вкладкам и компонентам клиента)"""
+
+    def __init__(self, queue_size=SSE_QUEUE_SIZE, max_subscribers=SSE_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = {}  # user_id -> [Subscription]
+        self._count = 0
+        self._listeners = []  # обработчики событий всех игроков (аналитика)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Новая подписка или None, если подписчиков слишком много"""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            subscription = Subscription(user_id, self.queue_size)
+            self._subscribers.setdefault(user_id, []).append(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+                self._count -= 1
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        return self._count
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subscribers
+
+    def listen(self, listener):
+        """Подписать listener(user_id, event, data) на события notify всех игроков"""
+        self._listeners.append(listener)
+
+    def notify(self, user_id, event, data):
+        """Служебное событие для слушателей шины; подписчикам SSE не уходит"""
+        for listener in self._listeners:
+            try:
+                listener(user_id, event, data)
+            except Exception as e:
+                print(f"Ошибка обработчика события {event}: {e}")
+
+    def publish(self, user_id, event, data):
+        subscriptions = self._subscribers.get(user_id)
+        if not subscriptions:
+            return
+        message = {"id": next(self._ids), "event": event, "data": data}
+        for subscription in list(subscriptions):
+            subscription.put(message)
+
+
+def format_sse(message):
+    """Событие в формате text/event-stream"""
+    data = json.dumps(message["data"], ensure_ascii=False, separators=(",", ":"))
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {data}\n\n"
@@ -0,0 +1,98 @@
+# backend/flusher.py
+import threading
+
+from metrics import STORAGE_WRITE_SECONDS
+
+
+class Flusher:
+    """Отложенное групповое сохранение игроков.
+
+    Изменение только помечает игрока "грязным" и сразу возвращается. Фоновый
+    поток раз в interval секунд (или раньше, когда грязных набралось batch)
+    снимает состояние всех грязных игроков и пишет их в хранилище одной
+    пачкой с одним fsync. Стоимость записи делится между всеми забросами,
+    попавшими в одно окно.
+    """
+
+    def __init__(self, storage, snapshot, interval=0.5, batch=256, on_flush=None, on_write=None):
+        self.storage = storage
+        self.snapshot = snapshot  # user_id -> JSON-словарь игрока (или None)
+        self.on_flush = on_flush  # вызывается после успешной записи
+        self.on_write = on_write  # получает записанные [(user_id, user)] - по порядку записей
+        self.interval = interval
+        self.batch = batch
+
+        self._dirty = set()
+        self._inflight = set()  # снятые, но ещё не записанные игроки
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="flusher", daemon=True)
+            self._thread.start()
+
+    def mark(self, user_id):
+        with self._dirty_lock:
+            self._dirty.add(user_id)
+            pending = len(self._dirty)
+        if pending >= self.batch:
+            self._wakeup.set()
+
+    def pending(self):
+        return len(self._dirty)
+
+    def is_clean(self, user_id):
+        """Все изменения игрока уже в хранилище"""
+        with self._dirty_lock:
+            return user_id not in self._dirty and user_id not in self._inflight
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Записать всех грязных игроков одной пачкой"""
+        with self._flush_lock:
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, set()
+                self._inflight = dirty
+            if not dirty:
+                return True
+
+            records = []
+            for user_id in dirty:
+                user = self.snapshot(user_id)
+                if user is not None:
+                    records.append((user_id, user))
+
+            try:
+                with STORAGE_WRITE_SECONDS.time("put_many"):
+                    saved = self.storage.put_many(records)
+            except Exception as e:
+                print(f"Ошибка группового сохранения: {e}")
+                saved = False
+            with self._dirty_lock:
+                if not saved:
+                    # Вернём игроков в очередь - запишем в следующем окне
+                    self._dirty.update(dirty)
+                self._inflight = set()
+            if saved and self.on_write is not None:
+                self.on_write(records)
+        if saved and self.on_flush is not None:
+            self.on_flush()
+        return saved
+
+    def close(self):
+        """Остановить поток и дописать всё, что накопилось"""
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -1,27 +1,90 @@
 # backend/game_logic.py
+import atexit
+import functools
+import glob
 import random
-import json
+import threading
 import os
+import time
 from math import isclose
-from datetime import datetime
+
+from analytics import Rollups
+from catalog import load_catalog
+from events import EventBus
+from flusher import Flusher
+from leaderboard import Leaderboard
+import loadout
+from locks import UserLocks
+from metrics import (
+    BROKEN_ITEMS, CASTS, CATCHES, GOLDEN_FISH, RESIDENT_EVICTIONS, RESIDENT_HITS, RESIDENT_MISSES,
+    STORAGE_WRITE_SECONDS,
+)
+from replication import ChangeLog, ReplicaTailer, ReplicationServer
+from residency import ResidentUsers
+from models import SLOTS, EquippedItem, Fish, Player, fish_names, item_names, now_time
+from storage import open_storage, shard_path
 
 # Константы игры
 DATA_FILE = "users.json"
+SQLITE_FILE = "users.db"
+STATS_FILE = "stats.json"  # часовые итоги аналитики (/api/stats)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "wal")  # "wal" (users.json + журнал) или "sqlite"
+CATALOG_FILE = os.environ.get("CATALOG_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json"))
+CATALOG_RELOAD_INTERVAL = float(os.environ.get("CATALOG_RELOAD_INTERVAL", "5"))  # секунды между проверками файла каталога (0 - не следить)
+MAX_FISH_BATCH = 1000  # максимум забросов в одном запросе fish_batch
+MAX_BATCH_OPERATIONS = 20  # максимум действий в одном запросе /api/batch
+SHARD_SEED_BATCH = 5000  # игроков в одной записи при переносе общего хранилища в шарды
+WORM_PRICE = 10  # цена одного червя
+ITEM_DURABILITY = 500  # забросов до поломки нового предмета
+BONUS_CACHE_DEBUG = os.environ.get("BONUS_CACHE_DEBUG") == "1"  # сверять кеш бонусов с полным пересчётом
+VECTOR_MIN_CASTS = 64  # с какой серии fish_batch разыгрывает забросы на numpy
+WAL_FSYNC_INTERVAL = float(os.environ.get("WAL_FSYNC_INTERVAL", "1.0"))  # секунды, 0 - fsync на каждую запись
+WAL_COMPACT_EVERY = int(os.environ.get("WAL_COMPACT_EVERY", "5000"))  # записей журнала до слияния в снапшот
+PERSIST_MODE = os.environ.get("PERSIST_MODE", "async")  # "async" - групповая запись в фоне, "sync" - запись в запросе (для тестов)
+FLUSH_INTERVAL = float(os.environ.get("FLUSH_INTERVAL", "0.5"))  # секунды между групповыми записями
+FLUSH_BATCH = int(os.environ.get("FLUSH_BATCH", "256"))  # столько грязных игроков запускают запись досрочно
+LAZY_LOAD = os.environ.get("LAZY_LOAD") == "1"  # не загружать игроков при старте, читать по одному при обращении
+RESIDENT_CAPACITY = int(os.environ.get("RESIDENT_CAPACITY", "0"))  # максимум игроков в памяти (0 - все), включает LAZY_LOAD
+RESIDENT_IDLE_SECONDS = float(os.environ.get("RESIDENT_IDLE_SECONDS", "0"))  # выгружать игроков, не нужных дольше (0 - нет)
+EVICTION_SCAN = 64  # сколько старых игроков просматривать сверх нужного при выгрузке
+STATS_SAVE_INTERVAL = float(os.environ.get("STATS_SAVE_INTERVAL", "60"))  # секунды между записями итогов аналитики
+SHARDS = int(os.environ.get("SHARDS", "1"))  # процессов с игроками (1 - игра в процессе веб-сервера)
+SHARD_INDEX = os.environ.get("SHARD_INDEX")  # номер шарда, задаётся процессу шарда
+REPLICATION_SOCKET = os.environ.get("REPLICATION_SOCKET")  # сокет журнала изменений для реплик (не задан - без реплик)
+REPLICA_OF = os.environ.get("REPLICA_OF")  # сокет основного процесса: этот процесс - реплика только для чтения
+REPLICA_MAX_STALENESS = float(os.environ.get("REPLICA_MAX_STALENESS", "5"))  # секунды, дольше - реплика не отвечает на чтения
+
+# Секции ответа /api/game/state. Версии секций берутся из общих часов, которые
+# идут по текущему времени в микросекундах и поэтому растут между перезапусками
+STATE_SECTIONS = ("user", "inventory", "equipped_items", "podsak", "last_catch", "bonuses")
+
+
+class VersionClock:
+    """Версии секций: текущее время в микросекундах, строго больше предыдущей версии.
+    
+    Версии ставит только основной процесс; реплики получают их вместе с
+    состоянием игрока, поэтому клиент может взять since у одного процесса
+    и спросить другой.
+    """
+    
+    def __init__(self):
+        self._last = 0
+        self._lock = threading.Lock()
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        with self._lock:
+            self._last = max(self._last + 1, time.time_ns() // 1000)
+            return self._last
 
-# Данные игры
-fishes = [
-    {"name": "Карась", "type": "карась", "min_weight": 0.2, "max_weight": 1.5, "abs_max": 2.5, "price_per_kg": 50},
-    {"name": "Щука", "type": "щука", "min_weight": 1.0, "max_weight": 5.0, "abs_max": 35.0, "price_per_kg": 150},
-    {"name": "Сом", "type": "сом", "min_weight": 5.0, "max_weight": 50.0, "abs_max": 450.0, "price_per_kg": 200},
-]
 
-rare_fishes = [{
-    "name": "Золотая рыбка",
-    "price_per_kg": 1000000,
-    "min_weight": 1.0,
-    "max_weight": 1.0,
-    "rarity": "legendary"
-}]
+_state_clock = VersionClock()
+
+# Данные игры: виды рыб, их веса, шансы и места рыбалки - в catalog.json
+default_catalog = load_catalog(CATALOG_FILE)
+fishes = [species.data for species in default_catalog.species.values() if not species.golden]
 
 all_items = {
     "Светлое пиво": {
@@ -146,63 +209,90 @@ all_items = {
     }
 }
 
+# id названий предметов в компактной модели игрока (рыбы интернирует каталог)
+for _item_name in all_items:
+    item_names.id(_item_name)
+
+# События, на которые срабатывают достижения
+ACHIEVEMENT_FISH_CAUGHT = "fish_caught"  # условие получает пойманную рыбу
+ACHIEVEMENT_BALANCE_CHANGED = "balance_changed"  # условие получает игрока
+
 achievements_list = [
     {
         "id": "golden_fish",
         "name": "🌟 Исполнилось желание",
         "description": "Поймай Золотую рыбку",
+        "trigger": ACHIEVEMENT_FISH_CAUGHT,
         "condition": lambda fish: fish.get("name") == "Золотая рыбка"
     },
     {
         "id": "fish_weight_14_88",
         "name": "🎯 Бог рыбалки",
         "description": "Поймай рыбу весом ровно 14.88 кг",
+        "trigger": ACHIEVEMENT_FISH_CAUGHT,
         "condition": lambda fish: isclose(fish.get('weight', 0), 14.88, abs_tol=0.01)
     },
     {
         "id": "fish_weight_100",
         "name": "💪 Монстр рыбалки",
         "description": "Поймай рыбу весом более 100 кг",
+        "trigger": ACHIEVEMENT_FISH_CAUGHT,
         "condition": lambda fish: fish.get("weight", 0) > 100
     },
     {
         "id": "rich_5m",
         "name": "🤑 Миллионер",
         "description": "Иметь на счету 5 000 000 рублей и больше",
-        "condition": lambda user: user.get("money", 0) >= 5_000_000
+        "trigger": ACHIEVEMENT_BALANCE_CHANGED,
+        "condition": lambda user: user.money >= 5_000_000
     },
     {
         "id": "big_money",
         "name": "💰 Богач",
         "description": "Поймай рыбу дороже 9980₽",
+        "trigger": ACHIEVEMENT_FISH_CAUGHT,
         "condition": lambda fish: fish.get('price', 0) > 9980
     },
     {
         "id": "fish_price_1488",
         "name": "💸 Рыбный миллиардер",
         "description": "Поймай рыбу стоимостью ровно 1488₽",
+        "trigger": ACHIEVEMENT_FISH_CAUGHT,
         "condition": lambda fish: fish.get('price', 0) == 1488
     },
     {
         "id": "pike_weight_2_28",
         "name": "👀 Вот ты и присел",
         "description": "Поймай щуку весом ровно 2.28 кг",
+        "trigger": ACHIEVEMENT_FISH_CAUGHT,
         "condition": lambda fish: fish.get('type', '').lower() == "щука" and isclose(fish.get('weight', 0), 2.28, abs_tol=0.01)
     },
     {
         "id": "catfish_weight_8_12",
         "name": "⚓ Глубины Питера",
         "description": "Поймай сома весом ровно 8.12 кг",
+        "trigger": ACHIEVEMENT_FISH_CAUGHT,
         "condition": lambda fish: fish.get('type', '').lower() == "сом" and isclose(fish.get('weight', 0), 8.12, abs_tol=0.01)
     },
     {
         "id": "fish_price_812",
         "name": "🌉 Северная рыбалка",
         "description": "Поймай рыбу стоимостью ровно 812₽",
+        "trigger": ACHIEVEMENT_FISH_CAUGHT,
         "condition": lambda fish: fish.get('price', 0) == 812
     }
 ]
 
+def compile_achievements(achievements):
+    """Таблица диспетчеризации: событие -> достижения, которые оно проверяет"""
+    rules = {}
+    for achievement in achievements:
+        rules.setdefault(achievement["trigger"], []).append(achievement)
+    return rules
+
+
+achievement_rules = compile_achievements(achievements_list)
+
 effect_descriptions = {
     "chance_bonus": "шанс поймать рыбу +{:.0%}",
     "rare_weight_bonus": "дополнительный вес редкой рыбы +{:.0%}",
@@ -210,239 +300,709 @@ effect_descriptions = {
     "crit_chance": "шанс критического улова +{:.2%}"
 }
 
+def normalize_user(player):
+    """Дополнение старых записей игроков отсутствующими полями"""
+    if player.inventory is None:
+        player.inventory = []
+    if player.items is None:
+        player.items = {slot: None for slot in SLOTS}
+    return player
+
+
+class Bonuses:
+    """Суммарные бонусы экипировки (фиксированный набор полей)"""
+    __slots__ = ("chance_bonus", "price_multiplier", "rare_weight_bonus", "crit_chance")
+    
+    def __init__(self, chance_bonus=0.0, price_multiplier=1.0, rare_weight_bonus=0.0, crit_chance=0.0):
+        self.chance_bonus = chance_bonus
+        self.price_multiplier = price_multiplier
+        self.rare_weight_bonus = rare_weight_bonus
+        self.crit_chance = crit_chance
+    
+    def __eq__(self, other):
+        return isinstance(other, Bonuses) and self.as_dict() == other.as_dict()
+    
+    def as_dict(self):
+        return {
+            "chance_bonus": self.chance_bonus,
+            "price_multiplier": self.price_multiplier,
+            "rare_weight_bonus": self.rare_weight_bonus,
+            "crit_chance": self.crit_chance
+        }
+
+
+def calculate_bonuses(effects_list):
+    """Суммарные бонусы набора эффектов предметов"""
+    bonuses = Bonuses()
+    
+    for effects in effects_list:
+        if effects:
+            bonuses.chance_bonus += effects.get("chance_bonus", 0.0)
+            bonuses.rare_weight_bonus += effects.get("rare_weight_bonus", 0.0)
+            bonuses.price_multiplier *= effects.get("price_multiplier", 1.0)
+            bonuses.crit_chance += effects.get("crit_chance", 0.0)
+    
+    return bonuses
+
+
+def create_simulator(spot=None):
+    """Векторный симулятор забросов на месте рыбалки (None, если numpy не установлен)"""
+    compiled = default_catalog.spot(spot)
+    if compiled is None:
+        raise ValueError(f"Неизвестное место рыбалки: {spot}")
+    return compiled.simulator
+
+
+def create_storage(backend=STORAGE_BACKEND, shard=None):
+    """Создание хранилища игроков по настройкам (у каждого шарда свои файлы)"""
+    if backend == "sqlite":
+        return open_storage("sqlite", shard_path(SQLITE_FILE, shard))
+    return open_storage("wal", shard_path(DATA_FILE, shard),
+                        fsync_interval=WAL_FSYNC_INTERVAL, compact_every=WAL_COMPACT_EVERY)
+
+
+def seed_shards(count):
+    """Разложить игроков общего хранилища по пустым шардам - до запуска их процессов.
+    
+    Общий файл читается один раз и только на чтение, игроки раскладываются
+    по шардам на лету. После переноса файл и его журналы получают суффикс
+    .sharded: дальше игроки живут только в файлах шардов.
+    """
+    from sharding import shard_of
+    
+    source_path = SQLITE_FILE if STORAGE_BACKEND == "sqlite" else DATA_FILE
+    if not os.path.exists(source_path):
+        return
+    targets = [create_storage(shard=shard) for shard in range(count)]
+    try:
+        for storage in targets:
+            storage.open()
+        if any(storage.count() for storage in targets):
+            print(f"Шарды уже заполнены - {source_path} не переносится")
+            return
+        
+        pending = [[] for _ in targets]
+        moved = 0
+        source = create_storage()
+        try:
+            for user_id, data in source.iter_records():
+                shard = shard_of(user_id, count)
+                pending[shard].append((user_id, data))
+                if len(pending[shard]) >= SHARD_SEED_BATCH:
+                    moved += _seed_shard(targets[shard], pending[shard])
+                    pending[shard] = []
+        finally:
+            source.close()
+        for storage, records in zip(targets, pending):
+            moved += _seed_shard(storage, records)
+            storage.checkpoint()
+    finally:
+        for storage in targets:
+            storage.close()
+    
+    for path in glob.glob(glob.escape(source_path) + "*"):
+        if not path.endswith(".sharded"):
+            os.replace(path, path + ".sharded")
+    print(f"Игроки из {source_path} перенесены в шарды: {moved}, общий файл переименован в {source_path}.sharded")
+
+
+def _seed_shard(storage, records):
+    if records and not storage.put_many(records):
+        raise RuntimeError("Не удалось записать игроков в хранилище шарда")
+    return len(records)
+
+
+def with_user_lock(method):
+    """Выполнение метода под блокировкой игрока (user_id - первый аргумент)"""
+    @functools.wraps(method)
+    def wrapper(self, user_id=None, *args, **kwargs):
+        if user_id is None:
+            return method(self, user_id, *args, **kwargs)
+        with self.locks.for_user(user_id):
+            return method(self, user_id, *args, **kwargs)
+    return wrapper
+
+
+# Действия /api/batch: аргументы берутся из операции под теми же именами, что в отдельных запросах
+BATCH_OPERATIONS = {
+    "fish": lambda game, user_id, op: game.fish(user_id, op.get("spot")),
+    "fish_batch": lambda game, user_id, op: game.fish_batch(user_id, op.get("count", 1), op.get("spot")),
+    "sell": lambda game, user_id, op: game.sell_fish(user_id),
+    "keep": lambda game, user_id, op: game.keep_fish(user_id),
+    "sellfish": lambda game, user_id, op: game.sell_fish_from_podsak(user_id, op.get("fish_index")),
+    "sell_bulk": lambda game, user_id, op: game.sell_bulk(
+        user_id, fish_ids=op.get("fish_ids"), species=op.get("species"),
+        min_weight=op.get("min_weight"), max_weight=op.get("max_weight"),
+        min_price=op.get("min_price"), max_price=op.get("max_price"), sell_all=op.get("all") is True),
+    "buy": lambda game, user_id, op: game.buy_item(user_id, op.get("item_name")),
+    "buy_worms": lambda game, user_id, op: game.buy_worms(user_id, op.get("count", 1)),
+    "buy_bag": lambda game, user_id, op: game.buy_bag_extension(user_id),
+    "equip": lambda game, user_id, op: game.equip_item(user_id, op.get("item_index")),
+    "unequip": lambda game, user_id, op: game.unequip_item(user_id, op.get("slot")),
+}
+
+
+def _is_int(value):
+    return type(value) is int  # True/False - не числа
+
+
+def _is_positive_int(value):
+    return _is_int(value) and value > 0
+
+
+def _is_number(value):
+    return not isinstance(value, bool) and isinstance(value, (int, float))
+
+
+def _is_str(value):
+    return isinstance(value, str)
+
+
+def _is_species(value):
+    return isinstance(value, str) or isinstance(value, list) and all(isinstance(name, str) for name in value)
+
+
+def _is_ids(value):
+    return isinstance(value, list) and all(_is_int(fish_id) for fish_id in value)
+
+
+# Аргументы действий /api/batch: имя -> (проверка, обязателен ли). Проверяются до выполнения батча
+BATCH_ARGUMENTS = {
+    "fish": {"spot": (_is_str, False)},
+    "fish_batch": {"count": (_is_positive_int, False), "spot": (_is_str, False)},
+    "sell": {},
+    "keep": {},
+    "sellfish": {"fish_index": (_is_int, True)},
+    "sell_bulk": {
+        "fish_ids": (_is_ids, False), "species": (_is_species, False),
+        "min_weight": (_is_number, False), "max_weight": (_is_number, False),
+        "min_price": (_is_number, False), "max_price": (_is_number, False),
+        "all": (lambda value: isinstance(value, bool), False),
+    },
+    "buy": {"item_name": (_is_str, True)},
+    "buy_worms": {"count": (_is_positive_int, False)},
+    "buy_bag": {},
+    "equip": {"item_index": (_is_int, True)},
+    "unequip": {"slot": (_is_str, True)},
+}
+
+
+def batch_argument_error(op):
+    """Описание ошибки в аргументах действия батча (None - аргументы в порядке)"""
+    for name, (check, required) in BATCH_ARGUMENTS[op["op"]].items():
+        value = op.get(name)
+        if value is None:
+            if required:
+                return f"Missing {name}"
+        elif not check(value):
+            return f"Invalid {name}"
+    return None
+
+
 class FishingGame:
-    def __init__(self):
-        self.users = self.load_users()
+    def __init__(self, storage=None, persist_mode=PERSIST_MODE, lazy=LAZY_LOAD,
+                 capacity=RESIDENT_CAPACITY, idle_seconds=RESIDENT_IDLE_SECONDS, stats_file=STATS_FILE,
+                 replication_socket=REPLICATION_SOCKET):
+        self._init_state(capacity, stats_file)
+        self.storage = storage if storage is not None else create_storage()
+        if lazy or capacity > 0 or idle_seconds > 0:
+            # Игроки читаются из хранилища при первом обращении,
+            # рейтинг строится в фоне по деньгам из индекса хранилища
+            self.storage.open()
+            threading.Thread(target=self._warm_leaderboard, name="leaderboard-warmup", daemon=True).start()
+        else:
+            for user_id, user in self.load_users().items():
+                self.users[user_id] = user
+                self.leaderboard.update(user_id, user.money)
+            self.leaderboard_ready.set()
+        if replication_socket:
+            # Всё, что записано в хранилище, уходит репликам в том же порядке
+            self.changes = ChangeLog()
+            ReplicationServer(self.changes, self._replication_snapshot).start(replication_socket)
+        if persist_mode != "sync":
+            # После записи игроки становятся чистыми - их можно выгружать
+            self.flusher = Flusher(self.storage, self._snapshot, FLUSH_INTERVAL, FLUSH_BATCH, on_flush=self._evict,
+                                   on_write=self._log_written if self.changes is not None else None)
+            self.flusher.start()
+        self.idle_seconds = idle_seconds
+        if idle_seconds > 0:
+            threading.Thread(target=self._evict_idle_loop, name="resident-sweeper", daemon=True).start()
+        self._warm_loadouts_async()
+        if CATALOG_RELOAD_INTERVAL > 0:
+            threading.Thread(target=self._reload_catalog_loop, name="catalog-reload", daemon=True).start()
+        if stats_file and STATS_SAVE_INTERVAL > 0:
+            threading.Thread(target=self._save_stats_loop, name="stats-saver", daemon=True).start()
+        atexit.register(self.close)
+    
+    def _init_state(self, capacity=0, stats_file=None):
+        """Состояние в памяти, общее для основного процесса и реплики"""
+        self.locks = UserLocks()
+        self.events = EventBus()
+        self.analytics = Rollups()
+        self.stats_file = stats_file
+        if stats_file:
+            self.analytics.load(stats_file)
+        self.events.listen(self.analytics.handle)
+        self.catalog = default_catalog
+        self._rejected_catalog = None  # mtime файла каталога, который не удалось загрузить
+        self.storage = None
+        self.leaderboard = Leaderboard()
+        self.leaderboard_ready = threading.Event()
+        self._loadout_reports = {}  # id места -> последний посчитанный отчёт по наборам экипировки
+        self._loadouts_lock = threading.Lock()
+        self._batches = {}  # user_id -> события и метрики, отложенные до конца /api/batch
+        self.users = ResidentUsers(capacity)
+        self.changes = None
+        self._written_versions = {}  # user_id -> версии секций состояния, снятого для групповой записи
+        self.flusher = None
+        self.idle_seconds = 0
+    
+    def close(self):
+        """Дописать отложенные изменения и закрыть хранилище"""
+        if self.flusher is not None:
+            self.flusher.close()
+        self.storage.close()
+        if self.stats_file:
+            self.analytics.save(self.stats_file)
+    
+    def _save_stats_loop(self):
+        while True:
+            time.sleep(STATS_SAVE_INTERVAL)
+            self.analytics.save(self.stats_file)
     
     def load_users(self):
-        """Загрузка данных пользователей"""
-        if os.path.exists(DATA_FILE):
+        """Загрузка данных пользователей из хранилища"""
+        try:
+            return {
+                user_id: Player.from_dict(data, all_items)
+                for user_id, data in self.storage.load_all().items()
+            }
+        except Exception as e:
+            print(f"Ошибка загрузки пользователей: {e}")
+            return {}
+    
+    def _warm_leaderboard(self):
+        try:
+            for user_id, money in self.storage.scan_money():
+                self.leaderboard.add_missing(user_id, money)
+        except Exception as e:
+            print(f"Ошибка построения рейтинга: {e}")
+        finally:
+            self.leaderboard_ready.set()
+    
+    def _warm_loadouts_async(self):
+        """Отчёты /api/loadouts по текущему каталогу считаются в фоне, до готовности выдаются прежние"""
+        if SHARD_INDEX not in (None, "0"):
+            return  # отчёты выдаёт только первый шард
+        threading.Thread(target=self._warm_loadouts, args=(self.catalog,), name="loadouts-warmup", daemon=True).start()
+    
+    def _warm_loadouts(self, catalog):
+        for spot in catalog.spots.values():
+            if self.catalog is not catalog:
+                return  # каталог снова сменился - считает поток нового каталога
             try:
-                with open(DATA_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                report = loadout.evaluate(catalog, spot, all_items, calculate_bonuses, WORM_PRICE, ITEM_DURABILITY)
             except Exception as e:
-                print(f"Ошибка загрузки пользователей: {e}")
-                return {}
-        return {}
+                print(f"Ошибка расчёта наборов экипировки для {spot.id}: {e}")
+                continue
+            with self._loadouts_lock:
+                if self.catalog is catalog:
+                    self._loadout_reports[spot.id] = report
     
-    def save_users(self):
-        """Сохранение данных пользователей"""
+    def stats(self):
+        """Игроки в памяти и ждущие группового сохранения"""
+        return {
+            "resident": len(self.users),
+            "dirty": self.flusher.pending() if self.flusher else 0
+        }
+    
+    def count_users(self):
+        """Число игроков (до прогрева рейтинга - по хранилищу)"""
+        if self.leaderboard_ready.is_set():
+            return len(self.leaderboard)
+        return max(self.storage.count(), len(self.users))
+    
+    def _get_user(self, user_id):
+        """Игрок по id (из памяти, иначе из хранилища)"""
+        user = self.users.touch(user_id)
+        if user is not None:
+            RESIDENT_HITS.inc()
+            return user
+        
+        # Под блокировкой игрока: его не материализуют дважды параллельно
+        with self.locks.for_user(user_id):
+            user = self.users.touch(user_id)
+            if user is None:
+                data = self.storage.get(user_id)
+                if data is not None:
+                    RESIDENT_MISSES.inc()
+                    user = self.users[user_id] = Player.from_dict(data, all_items)
+                    self._evict(keep=user_id)
+        return user
+    
+    def _evict(self, keep=None):
+        """Выгрузка давно не нужных игроков сверх ёмкости"""
+        excess = self.users.over_capacity()
+        if excess <= 0:
+            return
+        for user_id in self.users.oldest(excess + EVICTION_SCAN):
+            if user_id != keep and self._try_evict(user_id):
+                excess -= 1
+                if excess <= 0:
+                    return
+        # Несохранённых игроков выгрузим после ближайшей групповой записи
+    
+    def _try_evict(self, user_id):
+        """Выгрузить игрока, если он не занят и все его изменения записаны"""
+        lock = self.locks.for_user(user_id)
+        if not lock.acquire(blocking=False):
+            return False
         try:
-            with open(DATA_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.users, f, ensure_ascii=False, indent=2)
+            if self.flusher is not None and not self.flusher.is_clean(user_id):
+                return False
+            if self.users.pop(user_id) is None:
+                return False
+            RESIDENT_EVICTIONS.inc()
             return True
+        finally:
+            lock.release()
+    
+    def _evict_idle_loop(self):
+        interval = max(self.idle_seconds / 4, 1.0)
+        while True:
+            time.sleep(interval)
+            try:
+                for user_id in self.users.idle(self.idle_seconds):
+                    self._try_evict(user_id)
+                self._evict()
+            except Exception as e:
+                print(f"Ошибка выгрузки игроков: {e}")
+    
+    def reload_catalog(self, path=CATALOG_FILE):
+        """Перечитать каталог, если файл изменился. Каталог с ошибкой не заменяет рабочий"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime in (self.catalog.mtime, self._rejected_catalog):
+            return False
+        try:
+            catalog = load_catalog(path)
+        except Exception as e:
+            self._rejected_catalog = mtime  # о той же версии файла не сообщаем повторно
+            print(f"Ошибка загрузки каталога {path}: {e}")
+            return False
+        # Забросы берут ссылку на каталог один раз - подмена не рвёт их посередине
+        with self._loadouts_lock:
+            self.catalog = catalog
+        print(f"Каталог перезагружен: мест {len(catalog.spots)}, видов {len(catalog.species)}")
+        self._warm_loadouts_async()
+        return True
+    
+    def _reload_catalog_loop(self):
+        while True:
+            time.sleep(CATALOG_RELOAD_INTERVAL)
+            self.reload_catalog()
+    
+    def get_spots(self):
+        """Места рыбалки и шансы видов на них"""
+        return self.catalog.describe()
+    
+    def save_user(self, user_id):
+        """Сохранение изменений одного пользователя"""
+        if user_id in self._batches:
+            return True  # батч сохранит игрока один раз в конце
+        user = self.users[user_id]
+        # Все изменения денег проходят через сохранение - здесь же держим рейтинг
+        self.leaderboard.update(user_id, user.money)
+        if self.flusher is None:
+            data = user.to_dict()
+            with STORAGE_WRITE_SECONDS.time("put"):
+                saved = self.storage.put(user_id, data)
+            if saved and self.changes is not None:
+                self.changes.append([(user_id, data, dict(self._versions(user)))])
+            return saved
+        # Запись на диск - в ближайшем групповом сохранении
+        self.flusher.mark(user_id)
+        return True
+    
+    def _snapshot(self, user_id):
+        """JSON-состояние игрока для группового сохранения"""
+        with self.locks.for_user(user_id):
+            user = self.users.get(user_id)
+            if user is None:
+                return None
+            if self.changes is not None:
+                # Версии снимаются вместе с состоянием - реплика получит ровно их
+                self._written_versions[user_id] = dict(self._versions(user))
+            return user.to_dict()
+    
+    def _log_written(self, records):
+        """Записанные групповым сохранением игроки - в журнал изменений для реплик"""
+        self.changes.append([
+            (user_id, data, self._written_versions.pop(user_id)) for user_id, data in records
+        ])
+    
+    def _replication_snapshot(self):
+        """(user_id, user, версии секций) всех игроков для полной копии реплике"""
+        for user_id, data in self.storage.iter_records():
+            with self.locks.for_user(user_id):
+                user = self.users.get(user_id)
+                if user is not None:
+                    data, versions = user.to_dict(), dict(self._versions(user))
+                else:
+                    # Не в памяти: при загрузке игрок получит версии новее этих
+                    versions = dict.fromkeys(STATE_SECTIONS, next(_state_clock))
+            yield user_id, data, versions
+    
+    def save_users(self):
+        """Полное сохранение: запись грязных игроков и слияние журнала в снапшот"""
+        try:
+            if self.flusher is not None:
+                self.flusher.flush()
+            with STORAGE_WRITE_SECONDS.time("checkpoint"):
+                return self.storage.checkpoint()
         except Exception as e:
             print(f"Ошибка сохранения пользователей: {e}")
             return False
     
+    @with_user_lock
     def register_user(self, user_id, name):
         """Регистрация нового пользователя"""
         user_id = str(user_id)
         
-        if user_id not in self.users:
-            self.users[user_id] = {
-                "name": name,
-                "worms": 10,
-                "money": 0,
-                "catch": [],
-                "last_catch": None,
-                "achievements": [],
-                "bag_limit": 20,
-                "inventory": [],
-                "items": {
-                    "beer": None,
-                    "gear": None,
-                    "bait": None,
-                    "accessory": None
-                },
-                "created_at": datetime.now().isoformat(),
-                "last_active": datetime.now().isoformat()
-            }
-            self.save_users()
-            return {"status": "registered", "user": self.users[user_id]}
+        user = self._get_user(user_id)
+        if user is None:
+            user = Player(name)
+            user.bag_limit = 20
+            user.inventory = []
+            user.items = {slot: None for slot in SLOTS}
+            user.created_at = user.last_active = now_time()
+            self.users[user_id] = user
+            self._touch(user)
+            self.save_user(user_id)
+            self._evict(keep=user_id)
+            return {"status": "registered", "user": user.to_dict()}
         else:
             # Обновляем данные существующего пользователя
-            self.users[user_id]["name"] = name
-            self.users[user_id]["last_active"] = datetime.now().isoformat()
+            user.name = name
+            user.last_active = now_time()
             
             # Добавляем отсутствующие поля
-            if "inventory" not in self.users[user_id]:
-                self.users[user_id]["inventory"] = []
-            if "items" not in self.users[user_id]:
-                self.users[user_id]["items"] = {
-                    "beer": None,
-                    "gear": None,
-                    "bait": None,
-                    "accessory": None
-                }
+            normalize_user(user)
             
-            self.save_users()
-            return {"status": "existing", "user": self.users[user_id]}
+            self._touch(user)
+            self.save_user(user_id)
+            return {"status": "existing", "user": user.to_dict()}
     
-    def get_user_state(self, user_id):
-        """Получение состояния пользователя"""
+    @with_user_lock
+    def get_user_state(self, user_id, fields=None, since=None):
+        """Получение состояния пользователя
+        
+        fields - какие секции вернуть (по умолчанию все), since - версия,
+        которая уже есть у клиента: тогда возвращаются только секции,
+        изменившиеся после неё. Поле version всегда в ответе.
+        """
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return None
         
-        user = self.users[user_id]
-        
+        versions = self._versions(user)
+        sections = fields if fields is not None else STATE_SECTIONS
+        if since is not None:
+            sections = [section for section in sections if versions[section] > since]
+        
+        # JSON собирается здесь, под блокировкой игрока, и только для нужных секций
+        state = {}
+        for section in sections:
+            state[section] = self._state_section(user_id, user, section)
+        state["version"] = max(versions.values())
+        return state
+    
+    def _state_section(self, user_id, user, section):
+        if section == "user":
+            return {
+                "name": user.name,
+                "money": user.money,
+                "worms": user.worms,
+                "bag_limit": user.effective_bag_limit,
+                "achievements": list(user.achievements or ())
+            }
+        if section == "inventory":
+            return [item.to_dict() for item in user.inventory or ()]
+        if section == "equipped_items":
+            return {
+                slot: item.to_dict() if item else item
+                for slot, item in (user.items or {}).items()
+            }
+        if section == "podsak":
+            return user.catch.to_list()
+        if section == "last_catch":
+            return user.last_catch.to_dict() if isinstance(user.last_catch, Fish) else user.last_catch
         # Рассчитываем текущие бонусы от предметов
-        bonuses = self._calculate_bonuses(user)
-        
-        return {
-            "user": {
-                "name": user["name"],
-                "money": user["money"],
-                "worms": user["worms"],
-                "bag_limit": user.get("bag_limit", 20),
-                "achievements": user.get("achievements", [])
-            },
-            "inventory": user.get("inventory", []),
-            "equipped_items": user.get("items", {}),
-            "podsak": user.get("catch", []),
-            "last_catch": user.get("last_catch"),
-            "bonuses": bonuses
-        }
+        return self._get_bonuses(user_id, user).as_dict()
+    
+    def _versions(self, user):
+        """Версии секций игрока; у только что загруженного игрока все секции новые"""
+        if user.versions is None:
+            user.versions = dict.fromkeys(STATE_SECTIONS, next(_state_clock))
+        return user.versions
+    
+    def _touch(self, user, *sections):
+        """Отметить изменение секций состояния"""
+        version = next(_state_clock)
+        versions = self._versions(user)
+        for section in sections or STATE_SECTIONS:
+            versions[section] = version
+    
+    def _emit(self, user_id, user, event, **data):
+        """Событие для подписчиков /api/stream (version - для запроса изменений состояния)"""
+        if not self.events.has_subscribers(user_id):
+            return
+        data["version"] = max(self._versions(user).values())
+        pending = self._batches.get(user_id)
+        if pending is not None:
+            pending.append(functools.partial(self.events.publish, user_id, event, data))
+            return
+        self.events.publish(user_id, event, data)
+    
+    def _track(self, user_id, event, **data):
+        """Событие для аналитики (см. analytics.py); в батче - после его успешного завершения"""
+        pending = self._batches.get(user_id)
+        if pending is not None:
+            pending.append(functools.partial(self.events.notify, user_id, event, data))
+            return
+        self.events.notify(user_id, event, data)
+    
+    def _count(self, user_id, metric, amount=1):
+        """Счётчик метрик; в батче - после его успешного завершения"""
+        pending = self._batches.get(user_id)
+        if pending is not None:
+            pending.append(functools.partial(metric.inc, amount))
+            return
+        metric.inc(amount)
+    
+    def _emit_effects(self, user_id, user, broken_items=(), new_achievements=()):
+        """События о сломанных предметах и новых достижениях"""
+        if broken_items:
+            self._count(user_id, BROKEN_ITEMS, len(broken_items))
+            self._emit(user_id, user, "item_broken", items=broken_items)
+        for achievement in new_achievements:
+            self._track(user_id, "achievement", id=achievement["id"])
+            self._emit(user_id, user, "achievement", id=achievement["id"], name=achievement["name"])
     
     def _calculate_bonuses(self, user):
         """Расчет бонусов от экипировки"""
-        chance_bonus = 0.0
-        price_multiplier = 1.0
-        rare_weight_bonus = 0.0
-        crit_chance = 0.0
-        
-        for slot in ["beer", "gear", "bait", "accessory"]:
-            item = user.get("items", {}).get(slot)
-            if item:
-                effects = item.get("effect", {})
-                chance_bonus += effects.get("chance_bonus", 0.0)
-                rare_weight_bonus += effects.get("rare_weight_bonus", 0.0)
-                price_multiplier *= effects.get("price_multiplier", 1.0)
-                crit_chance += effects.get("crit_chance", 0.0)
-        
-        return {
-            "chance_bonus": chance_bonus,
-            "price_multiplier": price_multiplier,
-            "rare_weight_bonus": rare_weight_bonus,
-            "crit_chance": crit_chance
-        }
+        items = user.items or {}
+        return calculate_bonuses(
+            items[slot].effect for slot in SLOTS if items.get(slot)
+        )
     
-    def _generate_weight(self, fish_data, rare_bonus=0.0):
-        """Генерация веса рыбы с учетом бонусов"""
-        # Шанс поймать Золотую рыбку (0.0001%)
-        if random.random() < 0.000001:
-            fish_data = rare_fishes[0]
-            return 1.0, fish_data, True
-        
-        fish_data = random.choice(fishes)
+    def _get_bonuses(self, user_id, user):
+        """Бонусы из кеша; кеш сбрасывается при покупке, экипировке, снятии и поломке"""
+        bonuses = user.bonuses
+        if bonuses is None:
+            bonuses = user.bonuses = self._calculate_bonuses(user)
+        elif BONUS_CACHE_DEBUG:
+            fresh = self._calculate_bonuses(user)
+            if fresh != bonuses:
+                print(f"Кеш бонусов устарел для {user_id}: {bonuses.as_dict()} != {fresh.as_dict()}")
+                bonuses = user.bonuses = fresh
+        return bonuses
+    
+    def _invalidate_bonuses(self, user):
+        user.bonuses = None
+        self._touch(user, "bonuses")
+    
+    def _generate_weight(self, spot, rare_bonus=0.0):
+        """Вес и вид улова: вид - из таблицы места за O(1), вес - по параметрам вида"""
+        species = spot.sample()
+        return species.weight(rare_bonus), species
+    
+    def _check_achievements(self, user, event, subject):
+        """Проверка достижений события event (subject - словарь рыбы или игрок)"""
+        rules = achievement_rules.get(event)
+        if not rules:
+            return []
         
-        if fish_data["type"] == "сом" and random.random() < (0.001 + rare_bonus):
-            weight = round(
-                fish_data["max_weight"] + 0.01 +
-                min(random.expovariate(1) * 10, 450.0), 2
-            )
-        else:
-            weight = round(random.uniform(fish_data["min_weight"], fish_data["max_weight"]), 2)
+        if user.achievements is None:
+            user.achievements = {}
+        unlocked = user.achievements
         
-        return weight, fish_data, False
-    
-    def _check_achievements(self, user, fish=None):
-        """Проверка и выдача достижений"""
         new_achievements = []
-        
-        for achievement in achievements_list:
-            if achievement["id"] not in user.get("achievements", []):
-                got_achievement = False
-                try:
-                    if fish and achievement["condition"](fish):
-                        got_achievement = True
-                except Exception:
-                    pass
-                
-                if not got_achievement:
-                    try:
-                        if achievement["condition"](user):
-                            got_achievement = True
-                    except Exception:
-                        pass
-                
-                if got_achievement:
-                    user.setdefault("achievements", []).append(achievement["id"])
-                    new_achievements.append(achievement)
+        for achievement in rules:
+            if achievement["id"] not in unlocked and achievement["condition"](subject):
+                unlocked[achievement["id"]] = None
+                new_achievements.append(achievement)
         
         return new_achievements
     
-    def fish(self, user_id):
-        """Процесс рыбалки"""
+    @with_user_lock
+    def fish(self, user_id, spot=None):
+        """Процесс рыбалки (spot - место из каталога, по умолчанию основное)"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
         
-        user = self.users[user_id]
+        spot = self.catalog.spot(spot)
+        if spot is None:
+            return {"error": "Unknown spot"}
         
-        if user["worms"] <= 0:
+        if user.worms <= 0:
             return {"error": "No worms"}
         
-        user["worms"] -= 1
-        user["last_active"] = datetime.now().isoformat()
+        user.worms -= 1
+        user.last_active = now_time()
         
         # Получаем бонусы
-        bonuses = self._calculate_bonuses(user)
+        bonuses = self._get_bonuses(user_id, user)
         
         # Обновляем прочность предметов
         broken_items = self._update_item_durability(user)
         
-        base_fish_chance = 0.7
+        fish = self._roll_catch(bonuses, spot)
+        self._count(user_id, CASTS)
         
-        if random.random() < base_fish_chance + bonuses["chance_bonus"]:
+        if fish is not None:
             # Успешная рыбалка
-            weight, fish_data, is_golden = self._generate_weight(None, bonuses["rare_weight_bonus"])
-            
-            if is_golden:
-                price = int(weight * fish_data["price_per_kg"] * bonuses["price_multiplier"])
-                fish = {
-                    "name": fish_data["name"],
-                    "weight": weight,
-                    "price": price,
-                    "type": "золотая",
-                    "is_golden": True,
-                    "caught_at": datetime.now().isoformat()
-                }
-            else:
-                price = int(weight * fish_data["price_per_kg"] * bonuses["price_multiplier"])
-                fish = {
-                    "name": fish_data["name"],
-                    "weight": weight,
-                    "price": price,
-                    "type": fish_data["type"],
-                    "caught_at": datetime.now().isoformat()
-                }
-            
-            user["last_catch"] = fish
+            user.last_catch = fish
+            self._count(user_id, CATCHES)
+            if fish.is_golden:
+                self._count(user_id, GOLDEN_FISH)
+            fish_data = fish.to_dict()
             
             # Проверка достижений
-            new_achievements = self._check_achievements(user, fish)
+            new_achievements = self._check_achievements(user, ACHIEVEMENT_FISH_CAUGHT, fish_data)
             
-            self.save_users()
+            self._touch(user, "user", "last_catch", "equipped_items")
+            self.save_user(user_id)
+            self._track(user_id, "catch", casts=1, fish=[[fish.type or fish.name, fish.weight, 1]])
+            self._emit(user_id, user, "catch", fish=fish_data, worms=user.worms)
+            self._emit_effects(user_id, user, broken_items, new_achievements)
             
             result = {
                 "success": True,
-                "fish": fish,
+                "fish": fish_data,
                 "new_achievements": [{"name": ach["name"], "description": ach["description"]} for ach in new_achievements],
-                "worms_left": user["worms"],
+                "worms_left": user.worms,
                 "broken_items": broken_items
             }
             
             # Проверяем на гигантскую рыбу (для уведомлений)
-            if weight > 200 and not is_golden:
+            if fish.weight > 200 and not fish.is_golden:
                 result["is_giant"] = True
             
             return result
         else:
             # Неудачная рыбалка
-            user["last_catch"] = None
-            self.save_users()
+            user.last_catch = None
+            self._touch(user, "user", "last_catch", "equipped_items")
+            self.save_user(user_id)
+            self._track(user_id, "catch", casts=1, fish=[])
+            self._emit(user_id, user, "catch", fish=None, worms=user.worms)
+            self._emit_effects(user_id, user, broken_items)
             
             fail_messages = [
                 "Леска запуталась в камышах 🌿 и ты устроил бой с природой 1v1.",
@@ -458,291 +1018,601 @@ class FishingGame:
             return {
                 "success": False,
                 "message": random.choice(fail_messages),
-                "worms_left": user["worms"],
+                "worms_left": user.worms,
                 "broken_items": broken_items
             }
     
-    def _update_item_durability(self, user):
+    def _roll_catch(self, bonuses, spot):
+        """Один заброс: пойманная рыба (Fish) или None"""
+        if random.random() >= spot.base_chance + bonuses.chance_bonus:
+            return None
+        
+        weight, species = self._generate_weight(spot, bonuses.rare_weight_bonus)
+        price = int(weight * species.price_per_kg * bonuses.price_multiplier)
+        return Fish(species.name_id, weight, price, species.type_id, species.golden, now_time())
+    
+    @with_user_lock
+    def fish_batch(self, user_id, count, spot=None):
+        """Серия забросов за один запрос: улов сразу продаётся, возвращается сводка"""
+        user_id = str(user_id)
+        user = self._get_user(user_id)
+        if user is None:
+            return {"error": "User not found"}
+        
+        if isinstance(count, bool) or not isinstance(count, int) or count <= 0:
+            return {"error": "Invalid count"}
+        
+        spot = self.catalog.spot(spot)
+        if spot is None:
+            return {"error": "Unknown spot"}
+        
+        if user.worms <= 0:
+            return {"error": "No worms"}
+        
+        count = min(count, MAX_FISH_BATCH, user.worms)
+        
+        summary = {"caught": 0, "total_value": 0, "giants": 0, "golden": 0, "species": {}}
+        broken_items = []
+        new_achievements = []
+        
+        caught = []  # [вид, вес, количество] для аналитики
+        done = 0
+        while done < count:
+            # Бонусы не меняются, пока не сломается какой-нибудь предмет
+            bonuses = self._get_bonuses(user_id, user)
+            epoch = min(count - done, self._casts_until_break(user))
+            broken_items.extend(self._update_item_durability(user, epoch))
+            
+            if spot.simulator is not None and epoch >= VECTOR_MIN_CASTS:
+                # Длинная серия разыгрывается векторно, одинаковые уловы схлопываются
+                batch = spot.simulator.simulate(epoch, bonuses)
+                catches = spot.simulator.unique_catches(batch)
+            else:
+                catches = []
+                for _ in range(epoch):
+                    fish = self._roll_catch(bonuses, spot)
+                    if fish is not None:
+                        catches.append((fish.to_dict(), 1))
+            
+            for fish, times in catches:
+                self._add_to_batch_summary(summary, fish, times)
+                caught.append([fish.get("type", fish["name"]), fish["weight"], times])
+                new_achievements.extend(self._check_achievements(user, ACHIEVEMENT_FISH_CAUGHT, fish))
+            
+            done += epoch
+        
+        total_value = summary["total_value"]
+        self._count(user_id, CASTS, count)
+        self._count(user_id, CATCHES, summary["caught"])
+        self._count(user_id, GOLDEN_FISH, summary.pop("golden"))
+        user.worms -= count
+        user.money += total_value
+        user.last_catch = None
+        user.last_active = now_time()
+        new_achievements.extend(self._check_achievements(user, ACHIEVEMENT_BALANCE_CHANGED, user))
+        
+        self._touch(user, "user", "last_catch", "equipped_items")
+        self.save_user(user_id)
+        self._track(user_id, "catch", casts=count, fish=caught)
+        if total_value:
+            self._track(user_id, "minted", source="fish_batch", amount=total_value)
+        self._emit(user_id, user, "catch", casts=count, caught=summary["caught"], worms=user.worms)
+        self._emit(user_id, user, "balance", money=user.money)
+        self._emit_effects(user_id, user, broken_items, new_achievements)
+        
+        return {
+            "success": True,
+            "casts": count,
+            "caught": summary["caught"],
+            "species": summary["species"],
+            "total_value": total_value,
+            "new_balance": user.money,
+            "giants": summary["giants"],
+            "new_achievements": [{"name": ach["name"], "description": ach["description"]} for ach in new_achievements],
+            "worms_left": user.worms,
+            "broken_items": broken_items
+        }
+    
+    def _add_to_batch_summary(self, summary, fish, times):
+        """Учёт улова (times одинаковых рыб) в сводке fish_batch"""
+        summary["caught"] += times
+        summary["total_value"] += fish["price"] * times
+        stats = summary["species"].setdefault(fish["name"], {"count": 0, "weight": 0.0, "value": 0})
+        stats["count"] += times
+        stats["weight"] = round(stats["weight"] + fish["weight"] * times, 2)
+        stats["value"] += fish["price"] * times
+        if fish.get("is_golden"):
+            summary["golden"] += times
+        elif fish["weight"] > 200:
+            summary["giants"] += times
+    
+    def _casts_until_break(self, user):
+        """Сколько забросов выдержит экипировка до первой поломки"""
+        durabilities = [
+            item.durability if item.durability is not None else ITEM_DURABILITY
+            for item in (user.items or {}).values()
+            if item
+        ]
+        return max(min(durabilities), 1) if durabilities else MAX_FISH_BATCH
+    
+    def _update_item_durability(self, user, casts=1):
         """Обновление прочности предметов и возврат сломанных"""
         broken_items = []
+        items = user.items or {}
         
-        for slot in ["beer", "gear", "bait", "accessory"]:
-            item = user.get("items", {}).get(slot)
+        for slot in SLOTS:
+            item = items.get(slot)
             if item:
-                if "durability" not in item:
-                    item["durability"] = 500
+                if item.durability is None:
+                    item.durability = ITEM_DURABILITY
                 
-                item["durability"] -= 1
+                item.durability -= casts
                 
-                if item["durability"] <= 0:
-                    broken_items.append(item["name"])
-                    user["items"][slot] = None
+                if item.durability <= 0:
+                    broken_items.append(item.name)
+                    items[slot] = None
+        
+        if broken_items:
+            self._invalidate_bonuses(user)
         
         return broken_items
     
+    @with_user_lock
     def sell_fish(self, user_id):
         """Продажа последней пойманной рыбы"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
-        
-        user = self.users[user_id]
-        fish = user.get("last_catch")
+        fish = user.last_catch
         
         if not fish:
             return {"error": "No fish to sell"}
         
-        user["money"] += fish["price"]
-        user["last_catch"] = None
-        user["last_active"] = datetime.now().isoformat()
+        fish_data = fish.to_dict()
+        user.money += fish_data["price"]
+        user.last_catch = None
+        user.last_active = now_time()
+        new_achievements = self._check_achievements(user, ACHIEVEMENT_BALANCE_CHANGED, user)
         
-        self.save_users()
+        self._touch(user, "user", "last_catch")
+        self.save_user(user_id)
+        self._track(user_id, "minted", source="sell", amount=fish_data["price"])
+        self._emit(user_id, user, "balance", money=user.money)
+        self._emit_effects(user_id, user, new_achievements=new_achievements)
         
         return {
             "success": True,
-            "money_earned": fish["price"],
-            "new_balance": user["money"],
-            "fish_sold": fish
+            "money_earned": fish_data["price"],
+            "new_balance": user.money,
+            "fish_sold": fish_data,
+            "new_achievements": [{"name": ach["name"], "description": ach["description"]} for ach in new_achievements]
         }
     
+    @with_user_lock
     def keep_fish(self, user_id):
         """Сохранить рыбу в подсак"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
-        
-        user = self.users[user_id]
-        fish = user.get("last_catch")
+        fish = user.last_catch
         
         if not fish:
             return {"error": "No fish to keep"}
         
-        if len(user["catch"]) >= user.get("bag_limit", 20):
+        if len(user.catch) >= user.effective_bag_limit:
             return {"error": "Podsak full"}
         
-        user["catch"].append(fish)
-        user["last_catch"] = None
-        user["last_active"] = datetime.now().isoformat()
+        user.catch.append(fish)
+        user.last_catch = None
+        user.last_active = now_time()
         
-        self.save_users()
+        self._touch(user, "podsak", "last_catch")
+        self.save_user(user_id)
         
         return {
             "success": True,
-            "fish_kept": fish,
-            "podsak_count": len(user["catch"])
+            "fish_kept": fish.to_dict(),
+            "podsak_count": len(user.catch)
         }
     
+    @with_user_lock
     def sell_fish_from_podsak(self, user_id, fish_index):
         """Продажа рыбы из подсака"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
         
-        user = self.users[user_id]
-        
-        if fish_index < 0 or fish_index >= len(user["catch"]):
+        if fish_index < 0 or fish_index >= len(user.catch):
             return {"error": "Invalid fish index"}
         
-        fish = user["catch"].pop(fish_index)
-        user["money"] += fish["price"]
-        user["last_active"] = datetime.now().isoformat()
+        fish = user.catch.pop(fish_index)
+        user.money += fish.price
+        user.last_active = now_time()
+        new_achievements = self._check_achievements(user, ACHIEVEMENT_BALANCE_CHANGED, user)
         
-        self.save_users()
+        self._touch(user, "user", "podsak")
+        self.save_user(user_id)
+        self._track(user_id, "minted", source="sell_podsak", amount=fish.price)
+        self._emit(user_id, user, "balance", money=user.money)
+        self._emit_effects(user_id, user, new_achievements=new_achievements)
         
         return {
             "success": True,
-            "money_earned": fish["price"],
-            "new_balance": user["money"],
-            "fish_sold": fish
+            "money_earned": fish.price,
+            "new_balance": user.money,
+            "fish_sold": fish.to_dict(),
+            "new_achievements": [{"name": ach["name"], "description": ach["description"]} for ach in new_achievements]
+        }
+    
+    @with_user_lock
+    def sell_bulk(self, user_id, fish_ids=None, species=None, min_weight=None, max_weight=None,
+                  min_price=None, max_price=None, sell_all=False):
+        """Продажа рыб из подсака за один проход: всех, по фильтрам или по номерам"""
+        user_id = str(user_id)
+        user = self._get_user(user_id)
+        if user is None:
+            return {"error": "User not found"}
+        
+        filters = (fish_ids, species, min_weight, max_weight, min_price, max_price)
+        if not sell_all and all(value is None for value in filters):
+            return {"error": "No filter"}
+        
+        bounds = (min_weight, max_weight, min_price, max_price)
+        if any(value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))) for value in bounds):
+            return {"error": "Invalid filter"}
+        
+        if fish_ids is not None:
+            if not isinstance(fish_ids, list) or not all(type(fish_id) is int for fish_id in fish_ids):
+                return {"error": "Invalid fish ids"}
+            fish_ids = set(fish_ids)
+        
+        names = None
+        if species is not None:
+            if isinstance(species, str):
+                species = [species]
+            if not isinstance(species, list):
+                return {"error": "Invalid filter"}
+            # Вид можно задать названием или типом ("Щука" / "щука"):
+            # у старых рыб в подсаке поля type нет, поэтому тип переводим в название
+            names = set()
+            for name in species:
+                if isinstance(name, str):
+                    names.add(fish_names.find(name))
+                    names.add(fish_names.find(self.catalog.type_names.get(name)))
+            names.discard(None)
+        
+        indices = user.catch.select(names, min_weight, max_weight, min_price, max_price, fish_ids)
+        sold = user.catch.remove_many(indices)
+        money_earned = sum(fish.price for fish in sold)
+        
+        new_achievements = []
+        if sold:
+            user.money += money_earned
+            user.last_active = now_time()
+            new_achievements = self._check_achievements(user, ACHIEVEMENT_BALANCE_CHANGED, user)
+            
+            self._touch(user, "user", "podsak")
+            self.save_user(user_id)
+            self._track(user_id, "minted", source="sell_bulk", amount=money_earned)
+            self._emit(user_id, user, "balance", money=user.money)
+            self._emit_effects(user_id, user, new_achievements=new_achievements)
+        
+        result = {
+            "success": True,
+            "sold_count": len(sold),
+            "sold_ids": [fish.fish_id for fish in sold],
+            "money_earned": money_earned,
+            "new_balance": user.money,
+            "podsak": user.catch.to_list(),
+            "new_achievements": [{"name": ach["name"], "description": ach["description"]} for ach in new_achievements]
         }
+        if fish_ids is not None:
+            result["missing_ids"] = sorted(fish_ids - set(result["sold_ids"]))
+        return result
     
+    @with_user_lock
     def buy_item(self, user_id, item_name):
         """Покупка предмета в магазине"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
         
         if item_name not in all_items:
             return {"error": "Item not found"}
         
-        user = self.users[user_id]
         item_info = all_items[item_name]
         price = item_info["price"]
         
-        if user["money"] < price:
+        if user.money < price:
             return {"error": "Not enough money"}
         
         # Проверяем, свободен ли слот
         slot = item_info["type"]
-        if user["items"].get(slot) is not None:
+        if user.items.get(slot) is not None:
             return {"error": "Slot occupied"}
         
         # Покупка
-        user["money"] -= price
-        user["items"][slot] = {
-            "name": item_name,
-            "durability": 500,
-            "effect": item_info["effect"]
-        }
-        user["last_active"] = datetime.now().isoformat()
+        user.money -= price
+        user.items[slot] = EquippedItem(item_names.id(item_name), ITEM_DURABILITY, item_info["effect"])
+        self._invalidate_bonuses(user)
+        user.last_active = now_time()
         
-        self.save_users()
+        self._touch(user, "user", "equipped_items")
+        self.save_user(user_id)
+        self._track(user_id, "sunk", sink="items", amount=price)
+        self._emit(user_id, user, "balance", money=user.money)
         
         return {
             "success": True,
             "item_bought": item_name,
-            "new_balance": user["money"]
+            "new_balance": user.money
         }
     
+    @with_user_lock
     def buy_worms(self, user_id, count):
         """Покупка червей"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
+        cost = count * WORM_PRICE
         
-        user = self.users[user_id]
-        cost = count * 10
-        
-        if user["money"] < cost:
+        if user.money < cost:
             return {"error": "Not enough money"}
         
-        user["money"] -= cost
-        user["worms"] += count
-        user["last_active"] = datetime.now().isoformat()
+        user.money -= cost
+        user.worms += count
+        user.last_active = now_time()
         
-        self.save_users()
+        self._touch(user, "user")
+        self.save_user(user_id)
+        self._track(user_id, "sunk", sink="worms", amount=cost)
+        self._emit(user_id, user, "balance", money=user.money)
         
         return {
             "success": True,
             "worms_bought": count,
             "cost": cost,
-            "new_balance": user["money"],
-            "total_worms": user["worms"]
+            "new_balance": user.money,
+            "total_worms": user.worms
         }
     
+    @with_user_lock
     def buy_bag_extension(self, user_id):
         """Покупка расширения подсака"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
-        
-        user = self.users[user_id]
-        current_limit = user.get("bag_limit", 20)
+        current_limit = user.effective_bag_limit
         
         # Стоимость зависит от текущего размера
         cost = 10_000_000 if current_limit >= 40 else 500_000
         
-        if user["money"] < cost:
+        if user.money < cost:
             return {"error": "Not enough money"}
         
-        user["money"] -= cost
-        user["bag_limit"] = current_limit + 10
-        user["last_active"] = datetime.now().isoformat()
+        user.money -= cost
+        user.bag_limit = current_limit + 10
+        user.last_active = now_time()
         
-        self.save_users()
+        self._touch(user, "user")
+        self.save_user(user_id)
+        self._track(user_id, "sunk", sink="bag", amount=cost)
+        self._emit(user_id, user, "balance", money=user.money)
         
         return {
             "success": True,
-            "new_bag_limit": user["bag_limit"],
+            "new_bag_limit": user.bag_limit,
             "cost": cost,
-            "new_balance": user["money"]
+            "new_balance": user.money
         }
     
+    @with_user_lock
     def unequip_item(self, user_id, slot):
         """Снять предмет из слота"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
         
-        user = self.users[user_id]
-        valid_slots = ["beer", "gear", "bait", "accessory"]
-        
-        if slot not in valid_slots:
+        if slot not in SLOTS:
             return {"error": "Invalid slot"}
         
-        item = user["items"].get(slot)
+        item = user.items.get(slot)
         if not item:
             return {"error": "Slot already empty"}
         
         # Если предмет еще имеет прочность, добавляем в инвентарь
-        if item.get("durability", 0) > 0:
-            user.setdefault("inventory", []).append(item)
+        if (item.durability or 0) > 0:
+            if user.inventory is None:
+                user.inventory = []
+            user.inventory.append(item)
         
-        user["items"][slot] = None
-        user["last_active"] = datetime.now().isoformat()
+        user.items[slot] = None
+        self._invalidate_bonuses(user)
+        user.last_active = now_time()
         
-        self.save_users()
+        self._touch(user, "equipped_items", "inventory")
+        self.save_user(user_id)
         
         return {
             "success": True,
-            "item_unequipped": item["name"],
+            "item_unequipped": item.name,
             "slot": slot
         }
     
+    @with_user_lock
     def equip_item(self, user_id, item_index):
         """Экипировать предмет из инвентаря"""
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
-        
-        user = self.users[user_id]
-        inventory = user.get("inventory", [])
+        inventory = user.inventory or []
         
         if item_index < 0 or item_index >= len(inventory):
             return {"error": "Invalid item index"}
         
         item = inventory[item_index]
-        item_type = all_items.get(item["name"], {}).get("type")
+        item_type = all_items.get(item.name, {}).get("type")
         
         if not item_type:
             return {"error": "Unknown item type"}
         
         # Проверяем, свободен ли слот
-        if user["items"].get(item_type) is not None:
+        if user.items.get(item_type) is not None:
             return {"error": "Slot occupied"}
         
         # Экипируем предмет
-        user["items"][item_type] = item
+        user.items[item_type] = item
         del inventory[item_index]
-        user["last_active"] = datetime.now().isoformat()
+        self._invalidate_bonuses(user)
+        user.last_active = now_time()
         
-        self.save_users()
+        self._touch(user, "equipped_items", "inventory")
+        self.save_user(user_id)
         
         return {
             "success": True,
-            "item_equipped": item["name"],
+            "item_equipped": item.name,
             "slot": item_type
         }
     
+    @with_user_lock
+    def run_batch(self, user_id, operations, atomic=False):
+        """Несколько действий игрока за один запрос
+        
+        Действия выполняются по порядку под одной блокировкой игрока,
+        сохранение и события - один раз в конце. С atomic=True первая
+        ошибка откатывает игрока к состоянию до батча.
+        """
+        user_id = str(user_id)
+        user = self._get_user(user_id)
+        if user is None:
+            return {"error": "User not found"}
+        if not isinstance(operations, list) or not operations:
+            return {"error": "No operations"}
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return {"error": "Too many operations"}
+        if any(not isinstance(op, dict) or op.get("op") not in BATCH_OPERATIONS for op in operations):
+            return {"error": "Unknown operation"}
+        # Плохие аргументы отклоняют весь батч, пока ничего не выполнено
+        for index, op in enumerate(operations):
+            error = batch_argument_error(op)
+            if error is not None:
+                return {"error": error, "failed_index": index}
+        
+        backup = Player.from_dict(user.to_dict(), all_items) if atomic else None
+        pending = self._batches[user_id] = []
+        results = []
+        try:
+            for op in operations:
+                try:
+                    results.append(BATCH_OPERATIONS[op["op"]](self, user_id, op))
+                except Exception as e:
+                    print(f"Ошибка действия батча {op['op']}: {e}")
+                    results.append({"error": "Operation failed"})
+                if atomic and "error" in results[-1]:
+                    break
+        except BaseException:
+            del self._batches[user_id]
+            self._finish_batch(user_id, backup, pending)
+            raise
+        del self._batches[user_id]
+        
+        failed = atomic and "error" in results[-1]
+        self._finish_batch(user_id, backup if failed else None, pending)
+        result = {"success": not failed, "results": results, "state": self.get_user_state(user_id)}
+        if failed:
+            result["error"] = results[-1]["error"]
+            result["failed_index"] = len(results) - 1
+        return result
+    
+    def _finish_batch(self, user_id, backup, pending):
+        """Откат к копии игрока или одно сохранение, рассылка отложенных событий и метрик"""
+        if backup is not None:
+            # Все секции отката получают новые версии - клиенты перечитают их
+            self.users[user_id] = backup
+            self._touch(backup)
+            return
+        self.save_user(user_id)
+        for effect in pending:
+            effect()
+    
+    def top_entries(self, limit):
+        """Первые limit мест вместе с id игроков (из них собирается общий топ шардов)"""
+        entries = []
+        self.leaderboard_ready.wait()
+        for user_id, money in self.leaderboard.top(limit):
+            user = self._get_user(user_id)
+            entries.append({
+                "user_id": user_id,
+                "name": user.name,
+                "money": money,
+                "achievements_count": len(user.achievements or ())
+            })
+        
+        return entries
+    
     def get_top_players(self, limit=10):
         """Получение топа игроков"""
-        if not self.users:
-            return []
-        
-        sorted_users = sorted(self.users.items(), key=lambda x: x[1]["money"], reverse=True)
-        
-        top_list = []
-        for i, (user_id, user_data) in enumerate(sorted_users[:limit], 1):
-            top_list.append({
+        return [
+            {
                 "rank": i,
-                "name": user_data["name"],
-                "money": user_data["money"],
-                "achievements_count": len(user_data.get("achievements", []))
-            })
+                "name": entry["name"],
+                "money": entry["money"],
+                "achievements_count": entry["achievements_count"]
+            }
+            for i, entry in enumerate(self.top_entries(limit), 1)
+        ]
+    
+    def count_ahead(self, money, user_id):
+        """Сколько игроков выше игрока с такими деньгами"""
+        self.leaderboard_ready.wait()
+        return self.leaderboard.count_ahead(money, user_id)
+    
+    def get_player_rank(self, user_id):
+        """Место игрока в топе"""
+        user_id = str(user_id)
+        user = self._get_user(user_id)
+        if user is None:
+            return {"error": "User not found"}
         
-        return top_list
+        self.leaderboard_ready.wait()
+        return {
+            "rank": self.leaderboard.rank(user_id),
+            "name": user.name,
+            "money": user.money,
+            "achievements_count": len(user.achievements or ()),
+            "total_players": len(self.leaderboard)
+        }
     
+    @with_user_lock
     def get_achievements(self, user_id=None):
         """Получение достижений"""
         if not user_id:
-            return achievements_list
+            # Условия - функции, наружу отдаём только описание
+            return [
+                {
+                    "id": ach["id"],
+                    "name": ach["name"],
+                    "description": ach["description"],
+                    "trigger": ach["trigger"]
+                }
+                for ach in achievements_list
+            ]
         
         user_id = str(user_id)
-        if user_id not in self.users:
+        user = self._get_user(user_id)
+        if user is None:
             return {"error": "User not found"}
         
-        user = self.users[user_id]
-        user_achievements = user.get("achievements", [])
+        user_achievements = user.achievements or {}
         
         achievements_with_status = []
         for ach in achievements_list:
@@ -758,6 +1628,108 @@ class FishingGame:
     def get_shop_items(self):
         """Получение предметов магазина"""
         return all_items
+    
+    def get_stats(self, hours=24):
+        """Итоги улова и экономики за последние hours часов и за всё время"""
+        return self.analytics.report(hours)
+    
+    def get_loadouts(self, spot=None, limit=20, sort="profit"):
+        """Лучшие наборы экипировки по ожидаемому доходу на червя или на рубль (None - отчёт ещё считается)"""
+        spot_info = self.catalog.spot(spot)
+        if spot_info is None:
+            return {"error": "Unknown spot"}
+        if sort not in loadout.SORT_KEYS:
+            return {"error": "Invalid sort"}
+        report = self._loadout_reports.get(spot_info.id)
+        if report is None:
+            return None
+        return {
+            "spot": report["spot"],
+            "worm_price": report["worm_price"],
+            "durability": report["durability"],
+            "combinations": report["combinations"],
+            "baseline": report["baseline"],
+            "loadouts": loadout.top(report, sort, max(1, min(int(limit), report["combinations"])))
+        }
+
+
+class ReplicaGame(FishingGame):
+    """Игра реплики: только чтение, игроки приходят из журнала изменений основного процесса"""
+    
+    def __init__(self, address=REPLICA_OF):
+        # Без хранилища, группового сохранения и журнала для других реплик
+        self._init_state()
+        self.leaderboard_ready.set()
+        self._warm_loadouts_async()
+        self.tailer = ReplicaTailer(address, self._apply_change, self._reset_replica)
+        self.tailer.start()
+        if CATALOG_RELOAD_INTERVAL > 0:
+            threading.Thread(target=self._reload_catalog_loop, name="catalog-reload", daemon=True).start()
+    
+    def close(self):
+        pass
+    
+    def staleness(self):
+        return self.tailer.staleness()
+    
+    def _get_user(self, user_id):
+        return self.users.touch(user_id)
+    
+    def _apply_change(self, user_id, data, versions):
+        """Новое состояние игрока из журнала с версиями секций основного процесса"""
+        user = Player.from_dict(data, all_items)
+        user.versions = dict(versions)
+        with self.locks.for_user(user_id):
+            self.users[user_id] = user
+        self.leaderboard.update(user_id, user.money)
+    
+    def _reset_replica(self):
+        """Перед полной копией основного процесса"""
+        self.users = ResidentUsers()
+        self.leaderboard = Leaderboard()
+
+
+def _read_only(name):
+    def method(self, *args, **kwargs):
+        return {"error": "Read-only replica"}
+    method.__name__ = name
+    return method
+
 
-# Создаем глобальный экземпляр игры
-game_instance = FishingGame()
\ No newline at end of file
+for _name in ("register_user", "fish", "fish_batch", "sell_fish", "keep_fish", "sell_fish_from_podsak",
+              "sell_bulk", "buy_item", "buy_worms", "buy_bag_extension", "unequip_item", "equip_item",
+              "run_batch", "save_user", "save_users"):
+    setattr(ReplicaGame, _name, _read_only(_name))
+
+
+def create_game():
+    """Игра процесса: реплика, шард, фасад над шардами или вся игра целиком"""
+    if REPLICA_OF:
+        return ReplicaGame(REPLICA_OF)
+    if SHARD_INDEX is not None:
+        shard = int(SHARD_INDEX)
+        return FishingGame(create_storage(shard=shard), stats_file=shard_path(STATS_FILE, shard),
+                           replication_socket=REPLICATION_SOCKET and shard_path(REPLICATION_SOCKET, shard))
+    if SHARDS > 1:
+        from sharding import ShardedGame, start_shards
+        start_shards(SHARDS)  # под gunicorn шарды уже запущены мастером
+        return ShardedGame(SHARDS)
+    return FishingGame()
+
+
+_game_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """Глобальный экземпляр игры создаётся при первом обращении к game_instance.
+    
+    Импорт ради констант и таблиц (migrate.py, loadout.py, бенчмарки) не
+    открывает хранилище и не запускает потоки игры.
+    """
+    global game_instance
+    if name != "game_instance":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _game_lock:
+        if "game_instance" not in globals():
+            game_instance = create_game()
+    return game_instance
@@ -0,0 +1,43 @@
+# backend/gunicorn.conf.py
+import importlib.util
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Состояние игры живёт в памяти процесса, поэтому воркер один,
+# а параллельность даёт пул потоков (игроки защищены блокировками).
+# С gevent потоки становятся гринлетами: открытые /api/stream
+# не занимают по потоку на подписчика.
+# С SHARDS > 1 игроки живут в отдельных процессах-шардах, а воркеры
+# состояния не держат - их может быть сколько угодно.
+shards = int(os.environ.get("SHARDS", 1))
+workers = int(os.environ.get("WEB_WORKERS", 2)) if shards > 1 else 1
+if importlib.util.find_spec("gevent") is not None:
+    worker_class = "gevent"
+    worker_connections = int(os.environ.get("GUNICORN_CONNECTIONS", 1000))
+else:
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = 30
+
+
+def on_starting(server):
+    """Шарды запускаются мастером один раз, воркеры только подключаются к ним"""
+    if shards > 1:
+        import sharding
+        sharding.start_shards(shards)
+
+
+def on_exit(server):
+    if shards > 1:
+        import sharding
+        sharding.stop_shards()
+
+
+def worker_exit(server, worker):
+    """Дописать отложенные изменения игроков перед выходом воркера"""
+    game_logic = sys.modules.get("game_logic")
+    game = vars(game_logic).get("game_instance") if game_logic is not None else None
+    if game is not None:
+        game.close()
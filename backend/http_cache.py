@@ -0,0 +1,62 @@
+# backend/http_cache.py
+import gzip
+import hashlib
+import os
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость
+    brotli = None
+
+# Каталоги неизменны, но после деплоя могут поменяться - клиент каждый раз
+# переспрашивает сервер и получает 304 без тела, если ничего не изменилось
+CATALOG_CACHE_CONTROL = os.environ.get("CATALOG_CACHE_CONTROL", "public, max-age=0, must-revalidate")
+
+
+class CachedResponse:
+    """Заранее сериализованный и сжатый JSON-ответ для неизменных данных.
+
+    Тело строится один раз (так же, как это сделал бы jsonify), сжимается
+    gzip и, если доступен, brotli. Каждое представление получает сильный
+    ETag, а запрос с совпадающим If-None-Match получает 304.
+    """
+
+    def __init__(self, app, payload):
+        body = app.json.response(payload).get_data()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        # кодировка -> (тело, ETag)
+        self.variants = {"identity": (body, digest)}
+        self.variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), f"{digest}-gzip")
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body), f"{digest}-br")
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def _choose_encoding(self, request):
+        best, best_quality = "identity", 0
+        for encoding in ("br", "gzip"):
+            quality = request.accept_encodings[encoding]
+            if encoding in self.variants and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def serve(self, request):
+        encoding = self._choose_encoding(request)
+        body, etag = self.variants[encoding]
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": CATALOG_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+
+        # Любое из наших представлений у клиента актуально. If-None-Match
+        # сравнивается слабо (RFC 9110): W/"..." от прокси, который пережал
+        # ответ, тоже совпадает
+        if any(request.if_none_match.contains_weak(candidate) for candidate in self.etags) or request.if_none_match.star_tag:
+            return Response(status=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(body, mimetype="application/json", headers=headers)
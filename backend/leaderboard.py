@@ -0,0 +1,138 @@
+# backend/leaderboard.py
+import random
+import threading
+from math import log
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, next, width):
+        self.key = key
+        self.next = next
+        self.width = width
+
+
+# Хвостовой узел: его ключ больше любого (-money, user_id)
+_NIL = _Node((float("inf"),), [], [])
+
+
+class Leaderboard:
+    """Рейтинг игроков по деньгам на индексируемом skip list.
+
+    Ключ узла - (-money, user_id), поэтому порядок списка совпадает с
+    порядком топа. Обновление денег и место игрока - O(log n), первые N
+    мест - O(N). Ширины ссылок позволяют считать позицию при спуске.
+    """
+
+    MAX_LEVELS = 32
+
+    def __init__(self):
+        self._head = _Node(None, [_NIL] * self.MAX_LEVELS, [1] * self.MAX_LEVELS)
+        self._money = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._money)
+
+    def update(self, user_id, money):
+        """Обновить деньги игрока (без изменений - ничего не делает)"""
+        with self._lock:
+            old = self._money.get(user_id)
+            if old == money:
+                return
+            if old is not None:
+                self._remove((-old, user_id))
+            self._insert((-money, user_id))
+            self._money[user_id] = money
+
+    def add_missing(self, user_id, money):
+        """Добавить игрока, если его ещё нет (прогрев не перетирает свежие данные)"""
+        with self._lock:
+            if user_id not in self._money:
+                self._insert((-money, user_id))
+                self._money[user_id] = money
+
+    def remove(self, user_id):
+        with self._lock:
+            old = self._money.pop(user_id, None)
+            if old is not None:
+                self._remove((-old, user_id))
+
+    def top(self, limit):
+        """Первые limit мест: [(user_id, money)]"""
+        result = []
+        with self._lock:
+            node = self._head.next[0]
+            while node is not _NIL and len(result) < limit:
+                result.append((node.key[1], -node.key[0]))
+                node = node.next[0]
+        return result
+
+    def rank(self, user_id):
+        """Место игрока (с 1) или None"""
+        with self._lock:
+            money = self._money.get(user_id)
+            if money is None:
+                return None
+            key = (-money, user_id)
+            node = self._head
+            position = 0
+            for level in reversed(range(self.MAX_LEVELS)):
+                while node.next[level].key <= key:
+                    position += node.width[level]
+                    node = node.next[level]
+            return position
+
+    def count_ahead(self, money, user_id):
+        """Сколько игроков выше игрока с такими деньгами (сам он может быть в другом рейтинге)"""
+        key = (-money, user_id)
+        with self._lock:
+            node = self._head
+            position = 0
+            for level in reversed(range(self.MAX_LEVELS)):
+                while node.next[level].key < key:
+                    position += node.width[level]
+                    node = node.next[level]
+            return position
+
+    def _insert(self, key):
+        chain = [None] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = min(self.MAX_LEVELS, 1 - int(log(1.0 - random.random(), 2.0)))
+        new_node = _Node(key, [None] * levels, [None] * levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def _remove(self, key):
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
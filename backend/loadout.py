@@ -0,0 +1,260 @@
+# backend/loadout.py
+"""Ожидаемый доход наборов экипировки магазина.
+
+Для каждого сочетания предметов по слотам (пустой слот - тоже вариант)
+считается доход на одного червя и на рубль расходов: черви плюс износ
+предметов (цена / прочность). Ожидание считается по формулам: шанс
+поклёвки, таблица видов места, точное среднее цены по сетке округлённых
+весов и среднее трофейного хвоста. Монте-Карло в пуле процессов повторяет
+логику заброса (_roll_catch / _generate_weight) и нужен для проверки
+формул на лучших наборах.
+
+Отчёт кешируется по хешу каталога, магазина и цен - после правки
+баланса пересчитывается только то, что изменилось:
+
+    python loadout.py --spot pond --top 15 --sort per_ruble --verify 5 --casts 1000000
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog import load_catalog
+from models import SLOTS
+
+LOADOUT_CACHE_DIR = os.environ.get("LOADOUT_CACHE_DIR", "loadout_cache")
+MODEL_VERSION = 1  # меняется вместе с формулами - старые отчёты в кеше перестают подходить
+SORT_KEYS = {"profit": "profit_per_worm", "per_ruble": "value_per_ruble", "value": "value_per_worm"}
+
+_reports = {}  # ключ кеша -> отчёт
+_worker_catalogs = {}  # путь -> каталог в процессе пула
+
+
+def report_key(catalog, spot, items, worm_price, durability):
+    """Ключ кеша: всё, от чего зависит отчёт"""
+    payload = json.dumps(
+        [MODEL_VERSION, catalog.digest, spot.id, items, worm_price, durability],
+        ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def evaluate(catalog, spot, items, calculate_bonuses, worm_price, durability):
+    """Отчёт по всем наборам экипировки (из памяти, с диска или посчитанный заново)"""
+    key = report_key(catalog, spot, items, worm_price, durability)
+    report = _reports.get(key)
+    if report is None:
+        report = _read_cache(key)
+    if report is None:
+        report = _build_report(key, spot, items, calculate_bonuses, worm_price, durability)
+        _write_cache(key, report)
+    _reports[key] = report
+    return report
+
+
+def top(report, sort="profit", limit=20):
+    field = SORT_KEYS[sort]
+    return sorted(report["loadouts"], key=lambda row: row[field], reverse=True)[:limit]
+
+
+def _build_report(key, spot, items, calculate_bonuses, worm_price, durability):
+    options = []
+    for slot in SLOTS:
+        options.append([None] + sorted(name for name, info in items.items() if info["type"] == slot))
+
+    uniform_prices = {}  # (вид, множитель цены) -> среднее цены без трофея
+    loadouts = []
+    for names in itertools.product(*options):
+        chosen = [name for name in names if name is not None]
+        bonuses = calculate_bonuses(items[name]["effect"] for name in chosen)
+        catch_rate, value = expected_cast(spot, bonuses, uniform_prices)
+        cost = worm_price + sum(items[name]["price"] for name in chosen) / durability
+        loadouts.append({
+            "items": dict(zip(SLOTS, names)),
+            "bonuses": bonuses.as_dict(),
+            "catch_rate": round(catch_rate, 6),
+            "value_per_worm": round(value, 2),
+            "cost_per_worm": round(cost, 2),
+            "profit_per_worm": round(value - cost, 2),
+            "value_per_ruble": round(value / cost, 4),
+        })
+
+    return {
+        "key": key,
+        "spot": spot.id,
+        "worm_price": worm_price,
+        "durability": durability,
+        "combinations": len(loadouts),
+        "baseline": loadouts[0],  # все слоты пустые
+        "loadouts": loadouts,
+    }
+
+
+def expected_cast(spot, bonuses, uniform_prices=None):
+    """Шанс улова и средний доход одного заброса (пустой заброс - 0)"""
+    uniform_prices = uniform_prices if uniform_prices is not None else {}
+    multiplier = bonuses.price_multiplier
+    catch_rate = min(max(spot.base_chance + bonuses.chance_bonus, 0.0), 1.0)
+
+    value = 0.0
+    for species, probability in zip(spot.species, spot.probabilities):
+        key = (species.type, multiplier)
+        price = uniform_prices.get(key)
+        if price is None:
+            price = uniform_prices[key] = _uniform_price(species, multiplier)
+        if species.trophy_chance:
+            trophy = min(species.trophy_chance + bonuses.rare_weight_bonus, 1.0)
+            price = (1.0 - trophy) * price + trophy * _trophy_price(species, multiplier)
+        value += probability * price
+    return catch_rate, catch_rate * value
+
+
+def _uniform_price(species, multiplier):
+    """Среднее int(вес * цена за кг * множитель) для веса, равномерного на [min, max] и округлённого до 0.01"""
+    if species.span == 0:
+        return int(species.min_weight * species.price_per_kg * multiplier)
+    low = round(species.min_weight * 100)
+    high = round(species.max_weight * 100)
+    total = 0.0
+    for cents in range(low, high + 1):
+        # Крайние значения округления получают половину интервала
+        mass = min(cents + 0.5, high) - max(cents - 0.5, low)
+        total += mass * int(round(cents / 100, 2) * species.price_per_kg * multiplier)
+    return total / (high - low)
+
+
+def _trophy_price(species, multiplier):
+    """Среднее цены трофея: max_weight + 0.01 + min(Exp(1) * scale, cap).
+
+    E[min(X * scale, cap)] = scale * (1 - exp(-cap / scale)); отбрасывание
+    копеек при int() в среднем стоит полрубля.
+    """
+    tail = species.trophy_scale * (1.0 - math.exp(-species.trophy_cap / species.trophy_scale)) if species.trophy_scale else 0.0
+    weight = species.max_weight + 0.01 + tail
+    return max(weight * species.price_per_kg * multiplier - 0.5, 0.0)
+
+
+def _read_cache(key):
+    path = os.path.join(LOADOUT_CACHE_DIR, key + ".json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Ошибка чтения кеша наборов {path}: {e}")
+        return None
+
+
+def _write_cache(key, report):
+    try:
+        os.makedirs(LOADOUT_CACHE_DIR, exist_ok=True)
+        path = os.path.join(LOADOUT_CACHE_DIR, key + ".json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Ошибка записи кеша наборов: {e}")
+
+
+# Монте-Карло
+
+def monte_carlo(catalog_path, spot_id, bonuses_list, casts, workers=None, chunk=250_000, seed=0):
+    """Средний доход заброса и его стандартная ошибка для каждого набора бонусов.
+
+    Серии режутся на куски по chunk забросов и разыгрываются в пуле процессов.
+    """
+    tasks = []
+    for index, bonuses in enumerate(bonuses_list):
+        effects = (bonuses.chance_bonus, bonuses.rare_weight_bonus, bonuses.price_multiplier)
+        for start in range(0, casts, chunk):
+            tasks.append((index, catalog_path, spot_id, effects, min(chunk, casts - start), seed + len(tasks)))
+
+    sums = [[0, 0, 0] for _ in bonuses_list]  # сумма, сумма квадратов, забросы
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for index, total, total_sq, count in pool.map(_simulate_chunk, tasks):
+            sums[index][0] += total
+            sums[index][1] += total_sq
+            sums[index][2] += count
+
+    results = []
+    for total, total_sq, count in sums:
+        mean = total / count
+        variance = max(total_sq / count - mean * mean, 0.0)
+        results.append((mean, math.sqrt(variance / count)))
+    return results
+
+
+def _simulate_chunk(task):
+    """Кусок серии в процессе пула - та же логика, что _roll_catch"""
+    index, catalog_path, spot_id, effects, casts, seed = task
+    catalog = _worker_catalogs.get(catalog_path)
+    if catalog is None:
+        catalog = _worker_catalogs[catalog_path] = load_catalog(catalog_path)
+    spot = catalog.spot(spot_id)
+    chance_bonus, rare_bonus, multiplier = effects
+    chance = spot.base_chance + chance_bonus
+
+    rng = random.Random(seed)
+    total = total_sq = 0
+    for _ in range(casts):
+        if rng.random() >= chance:
+            continue
+        species = spot.sample(rng)
+        price = int(species.weight(rare_bonus, rng) * species.price_per_kg * multiplier)
+        total += price
+        total_sq += price * price
+    return index, total, total_sq, casts
+
+
+def main():
+    from game_logic import CATALOG_FILE, ITEM_DURABILITY, WORM_PRICE, all_items, calculate_bonuses, default_catalog
+
+    parser = argparse.ArgumentParser(description="Доходность наборов экипировки магазина")
+    parser.add_argument("--spot", default=None, help="место рыбалки (по умолчанию - основное)")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="profit")
+    parser.add_argument("--verify", type=int, default=0, help="проверить столько лучших наборов Монте-Карло")
+    parser.add_argument("--casts", type=int, default=1_000_000, help="забросов на один проверяемый набор")
+    parser.add_argument("--workers", type=int, default=None, help="процессов в пуле (по умолчанию - по числу ядер)")
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    args = parser.parse_args()
+
+    spot = default_catalog.spot(args.spot)
+    if spot is None:
+        parser.error(f"Неизвестное место рыбалки: {args.spot}")
+
+    report = evaluate(default_catalog, spot, all_items, calculate_bonuses, WORM_PRICE, ITEM_DURABILITY)
+    rows = top(report, args.sort, args.top)
+    if args.verify:
+        checked = rows[:args.verify]
+        bonuses_list = [calculate_bonuses(all_items[name]["effect"] for name in row["items"].values() if name)
+                        for row in checked]
+        estimates = monte_carlo(CATALOG_FILE, spot.id, bonuses_list, args.casts, args.workers)
+        for row, (mean, stderr) in zip(checked, estimates):
+            row["mc_value_per_worm"] = round(mean, 2)
+            row["mc_stderr"] = round(stderr, 2)
+
+    if args.json:
+        print(json.dumps({**report, "loadouts": rows}, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Место: {spot.name}, наборов: {report['combinations']}, червь: {WORM_PRICE}₽, прочность: {ITEM_DURABILITY}")
+    baseline = report["baseline"]
+    print(f"Без экипировки: {baseline['value_per_worm']}₽ за червя, {baseline['value_per_ruble']}₽ на рубль")
+    for place, row in enumerate(rows, 1):
+        items = ", ".join(name for name in row["items"].values() if name) or "без экипировки"
+        line = (f"{place:>3}. {row['profit_per_worm']:>10.2f}₽ прибыли за червя, "
+                f"{row['value_per_ruble']:>7.3f}₽ на рубль: {items}")
+        if "mc_value_per_worm" in row:
+            line += f" [МК: {row['mc_value_per_worm']} ± {row['mc_stderr']}, формула: {row['value_per_worm']}]"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# backend/locks.py
+import threading
+
+
+class UserLocks:
+    """Таблица блокировок игроков, разбитая на шарды.
+
+    Блокировка выбирается по хешу user_id, поэтому память не растёт с числом
+    игроков, а действия разных игроков почти никогда не ждут друг друга.
+    Блокировки реентерабельные: метод под блокировкой может вызвать другой.
+    """
+
+    def __init__(self, shards=64):
+        self._locks = [threading.RLock() for _ in range(shards)]
+
+    def for_user(self, user_id):
+        return self._locks[hash(str(user_id)) % len(self._locks)]
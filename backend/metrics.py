@@ -0,0 +1,260 @@
+# backend/metrics.py
+"""Счётчики и гистограммы в текстовом формате Prometheus.
+
+Каждый поток пишет в свою ячейку без блокировок, ячейки складываются
+только при чтении /api/metrics. Когда поток завершается, его ячейка
+вливается в общую ячейку завершённых потоков - число ячеек не растёт от
+потоков на соединение (шарды, репликация, gthread). Под gevent ячейка
+принадлежит гринлету, если модуль импортирован после monkey-patch, иначе
+гринлеты потока делят одну ячейку - переключения там происходят только
+на вводе-выводе, поэтому увеличение счётчика не разрывается.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._cells = {}  # id владельца -> {значения меток: данные} живого потока
+        self._retired = {}  # данные завершившихся потоков
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _cell(self):
+        owner = getattr(self._local, "owner", None)
+        if owner is None:
+            owner = self._local.owner = _CellOwner(self)
+        return owner.cell
+
+    def _retire(self, key, cell):
+        with self._lock:
+            self._cells.pop(key, None)
+            for label_values, data in cell.items():
+                self._retired[label_values] = self._merge(self._retired.get(label_values), data)
+
+    def _snapshots(self):
+        with self._lock:
+            cells = list(self._cells.values())
+            retired = dict(self._retired)
+        # Копия словаря делается целиком под GIL
+        return [dict(cell) for cell in cells] + [retired]
+
+    def _label_text(self, values, extra=""):
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _CellOwner:
+    """Ячейка потока в threading.local: при завершении потока её данные
+    переходят в общую ячейку метрики"""
+    __slots__ = ("metric", "cell")
+
+    def __init__(self, metric):
+        self.metric = metric
+        self.cell = {}
+        with metric._lock:
+            metric._cells[id(self)] = self.cell
+
+    def __del__(self):
+        self.metric._retire(id(self), self.cell)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    @staticmethod
+    def _merge(total, value):
+        return value if total is None else total + value
+
+    def inc(self, amount=1, *label_values):
+        cell = self._cell()
+        cell[label_values] = cell.get(label_values, 0) + amount
+
+    def _samples(self):
+        totals = {}
+        for cell in self._snapshots():
+            for key, value in cell.items():
+                totals[key] = totals.get(key, 0) + value
+        if not totals and not self.labels:
+            totals[()] = 0
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in sorted(totals.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    @staticmethod
+    def _merge(total, data):
+        # Новый список, а не изменение старого: снимок читает его без блокировки
+        return list(data) if total is None else [a + b for a, b in zip(total, data)]
+
+    def observe(self, value, *label_values):
+        cell = self._cell()
+        data = cell.get(label_values)
+        if data is None:
+            # [счётчики корзин..., +Inf, сумма]
+            data = cell[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def _samples(self):
+        totals = {}
+        for cell in self._snapshots():
+            for key, data in cell.items():
+                total = totals.setdefault(key, [0] * len(data[:-1]) + [0.0])
+                for index, value in enumerate(data):
+                    total[index] += value
+
+        lines = []
+        for key, data in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                labels = self._label_text(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(data[-1])}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Последнее значение или функция, которая считает его при чтении"""
+    kind = "gauge"
+
+    def __init__(self, name, help, fn=None):
+        super().__init__(name, help)
+        self.fn = fn
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def _samples(self):
+        value = self.fn() if self.fn is not None else self.value
+        return [f"{self.name} {_number(value)}"]
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def merge_text(texts):
+    """Сложить одинаковые ряды из нескольких выводов render() (процессы-шарды)"""
+    headers = {}  # метрика -> строки HELP и TYPE
+    series = {}  # метрика -> {ряд: значение}
+    metric = None
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith("# "):
+                metric = line.split(" ", 3)[2]
+                lines = headers.setdefault(metric, [])
+                if len(lines) < 2:
+                    lines.append(line)
+                series.setdefault(metric, {})
+            elif line and metric is not None:
+                key, value = line.rsplit(" ", 1)
+                value = float(value) if "." in value or "e" in value else int(value)
+                samples = series[metric]
+                samples[key] = samples.get(key, 0) + value
+    lines = []
+    for metric, header in headers.items():
+        lines.extend(header)
+        lines.extend(f"{key} {_number(value)}" for key, value in series[metric].items())
+    return "\n".join(lines) + "\n"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.sources = []  # функции, возвращающие выводы render() других процессов
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn=None):
+        return self.register(Gauge(name, help, fn))
+
+    def add_source(self, fn):
+        self.sources.append(fn)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        text = "\n".join(lines) + "\n"
+        if not self.sources:
+            return text
+
+        texts = [text]
+        for source in self.sources:
+            try:
+                texts.extend(source())
+            except Exception as e:
+                print(f"Ошибка чтения метрик: {e}")
+        return merge_text(texts)
+
+
+registry = Registry()
+
+# Метрики игры
+REQUEST_SECONDS = registry.histogram(
+    "fishing_request_seconds", "Время обработки запроса", ("method", "route", "status"))
+STORAGE_WRITE_SECONDS = registry.histogram(
+    "fishing_storage_write_seconds", "Время записи в хранилище", ("operation",))
+SNAPSHOT_BYTES = registry.gauge("fishing_snapshot_bytes", "Размер последнего снапшота users.json")
+CASTS = registry.counter("fishing_casts_total", "Забросы")
+CATCHES = registry.counter("fishing_catches_total", "Пойманные рыбы")
+GOLDEN_FISH = registry.counter("fishing_golden_fish_total", "Пойманные золотые рыбки")
+BROKEN_ITEMS = registry.counter("fishing_broken_items_total", "Сломанные предметы")
+RESIDENT_HITS = registry.counter("fishing_resident_hits_total", "Обращения к игрокам, уже загруженным в память")
+RESIDENT_MISSES = registry.counter("fishing_resident_misses_total", "Загрузки игроков из хранилища")
+RESIDENT_EVICTIONS = registry.counter("fishing_resident_evictions_total", "Выгрузки игроков из памяти")
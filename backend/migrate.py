@@ -0,0 +1,40 @@
+# backend/migrate.py
+"""Разовая миграция users.json (со снапшотом журнала) в SQLite.
+
+Использование: python migrate.py [users.json] [users.db]
+"""
+import sys
+
+from game_logic import DATA_FILE, SQLITE_FILE, all_items, normalize_user  # без game_instance: игра не создаётся
+from models import Player
+from storage import SqliteStorage, WalStorage
+
+
+def migrate_json_to_sqlite(json_path=DATA_FILE, db_path=SQLITE_FILE):
+    """Перенос всех игроков из users.json (+ журнал) в SQLite; None - запись не удалась"""
+    # iter_records только читает файлы источника: журнал рядом с ним не создаётся
+    source = WalStorage(json_path, fsync_interval=0)
+
+    target = SqliteStorage(db_path)
+    try:
+        saved = target.put_many(
+            (str(user_id), normalize_user(Player.from_dict(user, all_items)).to_dict())
+            for user_id, user in source.iter_records()
+        )
+        if not saved:
+            return None  # транзакция откатилась - в базе ничего не изменилось
+        migrated = target.count()
+        target.checkpoint()
+        return migrated
+    finally:
+        target.close()
+
+
+if __name__ == "__main__":
+    json_path = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+    db_path = sys.argv[2] if len(sys.argv) > 2 else SQLITE_FILE
+    count = migrate_json_to_sqlite(json_path, db_path)
+    if count is None:
+        print(f"Ошибка: игроки не перенесены ({json_path} -> {db_path})")
+        sys.exit(1)
+    print(f"✅ Перенесено игроков: {count} ({json_path} -> {db_path})")
@@ -0,0 +1,437 @@
+# backend/models.py
+"""Компактная модель игрока в памяти.
+
+Вместо словарей со строковыми ключами игрок хранится в объектах со
+__slots__: названия рыб и предметов интернированы в маленькие целые id,
+время хранится целым числом микросекунд, а подсак - набором массивов.
+В JSON модель превращается только на границе API и хранилища, и
+to_dict() возвращает ровно те же поля, что были в исходной записи.
+"""
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+SLOTS = ("beer", "gear", "bait", "accessory")
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class Names:
+    """Интернирование строк в маленькие целые id"""
+
+    def __init__(self, names=()):
+        self._ids = {}
+        self._names = []
+        self._lock = threading.Lock()  # новые названия приходят и из фоновых потоков (перезагрузка каталога)
+        for name in names:
+            self.id(name)
+
+    def id(self, name):
+        name_id = self._ids.get(name)
+        if name_id is None:
+            with self._lock:
+                name_id = self._ids.get(name)
+                if name_id is None:
+                    name_id = len(self._names)
+                    self._names.append(name)
+                    self._ids[name] = name_id
+        return name_id
+
+    def name(self, name_id):
+        return self._names[name_id]
+
+    def find(self, name):
+        """id уже известной строки или None (без интернирования)"""
+        return self._ids.get(name)
+
+
+# Названия и типы рыб, названия предметов (заполняются из каталогов игры)
+fish_names = Names()
+item_names = Names()
+
+
+def now_time():
+    """Текущее время в микросекундах от эпохи (локальное, как datetime.now())"""
+    return (datetime.now() - _EPOCH) // _MICROSECOND
+
+
+def parse_time(value):
+    """ISO-строка -> микросекунды, если преобразование обратимо без потерь"""
+    if not isinstance(value, str):
+        return value
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if moment.tzinfo is not None:
+        return value
+    micros = (moment - _EPOCH) // _MICROSECOND
+    return micros if format_time(micros) == value else value
+
+
+def format_time(value):
+    """Микросекунды -> ISO-строка (строки и None возвращаются как есть)"""
+    if isinstance(value, int):
+        return (_EPOCH + timedelta(microseconds=value)).isoformat()
+    return value
+
+
+class Fish:
+    """Пойманная рыба"""
+    __slots__ = ("name_id", "weight", "price", "type_id", "is_golden", "caught_at", "extra", "fish_id")
+
+    def __init__(self, name_id, weight, price, type_id=None, is_golden=False, caught_at=None, extra=None, fish_id=None):
+        self.name_id = name_id
+        self.weight = weight
+        self.price = price
+        self.type_id = type_id
+        self.is_golden = is_golden
+        self.caught_at = caught_at
+        self.extra = extra
+        self.fish_id = fish_id  # постоянный номер рыбы в подсаке игрока
+
+    @property
+    def name(self):
+        return fish_names.name(self.name_id)
+
+    @property
+    def type(self):
+        return fish_names.name(self.type_id) if self.type_id is not None else None
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        name_id = fish_names.id(data.pop("name"))
+        weight = data.pop("weight")
+        price = data.pop("price")
+        type_id = fish_names.id(data.pop("type")) if isinstance(data.get("type"), str) else None
+        is_golden = data.get("is_golden") is True
+        if is_golden:
+            del data["is_golden"]
+        caught_at = parse_time(data.pop("caught_at")) if "caught_at" in data else None
+        fish_id = data.pop("id") if type(data.get("id")) is int else None
+        return cls(name_id, weight, price, type_id, is_golden, caught_at, data or None, fish_id)
+
+    def to_dict(self):
+        data = {
+            "name": fish_names.name(self.name_id),
+            "weight": self.weight,
+            "price": self.price,
+        }
+        if self.type_id is not None:
+            data["type"] = fish_names.name(self.type_id)
+        if self.is_golden:
+            data["is_golden"] = True
+        if self.caught_at is not None:
+            data["caught_at"] = format_time(self.caught_at)
+        if self.fish_id is not None:
+            data["id"] = self.fish_id
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+# Флаги строки CatchList
+_HAS_TYPE = 1
+_GOLDEN = 2
+_HAS_CAUGHT_AT = 4
+_INT_WEIGHT = 8
+_NO_TYPE = 0xFFFF
+_NO_TIME = -(2 ** 63)
+
+
+class CatchList:
+    """Подсак на параллельных массивах.
+
+    Рыбы, которые не укладываются в колонки (лишние поля, нестандартные
+    типы значений), хранятся целиком объектами Fish в редком списке _odd.
+    Каждая рыба получает постоянный номер (id): номера не переиспользуются,
+    поэтому клиент может ссылаться на рыбу, не боясь сдвига индексов.
+    """
+    __slots__ = ("_names", "_types", "_weights", "_prices", "_caught", "_flags", "_ids", "_odd", "next_id")
+
+    def __init__(self, fishes=(), next_id=1):
+        self._names = array("H")
+        self._types = array("H")
+        self._weights = array("d")
+        self._prices = array("q")
+        self._caught = array("q")
+        self._flags = array("B")
+        self._ids = array("q")
+        self._odd = None
+        self.next_id = next_id
+        for fish in fishes:
+            self.append(fish)
+
+    @classmethod
+    def from_list(cls, items, next_id=1):
+        fishes = [Fish.from_dict(item) for item in items]
+        # Номер следующей рыбы - больше всех уже выданных
+        for fish in fishes:
+            if fish.fish_id is not None and fish.fish_id >= next_id:
+                next_id = fish.fish_id + 1
+        return cls(fishes, next_id)
+
+    def __len__(self):
+        return len(self._flags)
+
+    def __iter__(self):
+        for index in range(len(self._flags)):
+            yield self[index]
+
+    @staticmethod
+    def _fits_columns(fish):
+        return (
+            fish.extra is None
+            and type(fish.weight) in (float, int)
+            and type(fish.price) is int and -2 ** 63 < fish.price < 2 ** 63
+            and (fish.caught_at is None or type(fish.caught_at) is int)
+        )
+
+    def append(self, fish):
+        if fish.fish_id is None:
+            fish.fish_id = self.next_id
+        self.next_id = max(self.next_id, fish.fish_id + 1)
+        self._ids.append(fish.fish_id)
+
+        odd = not self._fits_columns(fish)
+        if odd and self._odd is None:
+            self._odd = [None] * len(self._flags)
+
+        if odd:
+            self._odd.append(fish)
+            self._names.append(0)
+            self._types.append(_NO_TYPE)
+            self._weights.append(0.0)
+            self._prices.append(0)
+            self._caught.append(_NO_TIME)
+            self._flags.append(0)
+            return
+
+        flags = 0
+        if fish.type_id is not None:
+            flags |= _HAS_TYPE
+        if fish.is_golden:
+            flags |= _GOLDEN
+        if fish.caught_at is not None:
+            flags |= _HAS_CAUGHT_AT
+        if type(fish.weight) is int:
+            flags |= _INT_WEIGHT
+        if self._odd is not None:
+            self._odd.append(None)
+        self._names.append(fish.name_id)
+        self._types.append(fish.type_id if fish.type_id is not None else _NO_TYPE)
+        self._weights.append(fish.weight)
+        self._prices.append(fish.price)
+        self._caught.append(fish.caught_at if fish.caught_at is not None else _NO_TIME)
+        self._flags.append(flags)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._flags)
+        if not 0 <= index < len(self._flags):
+            raise IndexError("catch index out of range")
+        if self._odd is not None and self._odd[index] is not None:
+            return self._odd[index]
+
+        flags = self._flags[index]
+        weight = self._weights[index]
+        return Fish(
+            self._names[index],
+            int(weight) if flags & _INT_WEIGHT else weight,
+            self._prices[index],
+            self._types[index] if flags & _HAS_TYPE else None,
+            bool(flags & _GOLDEN),
+            self._caught[index] if flags & _HAS_CAUGHT_AT else None,
+            None,
+            self._ids[index],
+        )
+
+    def _columns(self):
+        return (self._names, self._types, self._weights, self._prices, self._caught, self._flags, self._ids)
+
+    def pop(self, index=-1):
+        fish = self[index]
+        for column in self._columns():
+            column.pop(index)
+        if self._odd is not None:
+            self._odd.pop(index)
+        return fish
+
+    def ids(self):
+        return self._ids.tolist()
+
+    def select(self, names=None, min_weight=None, max_weight=None, min_price=None, max_price=None, ids=None):
+        """Индексы рыб, подходящих под все заданные условия.
+
+        names - множество id названий и типов рыб (fish_names), ids - номера рыб.
+        """
+        selected = []
+        for index in range(len(self._flags)):
+            fish = self._odd[index] if self._odd is not None else None
+            if fish is not None:
+                name_id, type_id, weight, price = fish.name_id, fish.type_id, fish.weight, fish.price
+            else:
+                flags = self._flags[index]
+                name_id = self._names[index]
+                type_id = self._types[index] if flags & _HAS_TYPE else None
+                weight = self._weights[index]
+                price = self._prices[index]
+            if ids is not None and self._ids[index] not in ids:
+                continue
+            if names is not None and name_id not in names and type_id not in names:
+                continue
+            if min_weight is not None and weight < min_weight:
+                continue
+            if max_weight is not None and weight > max_weight:
+                continue
+            if min_price is not None and price < min_price:
+                continue
+            if max_price is not None and price > max_price:
+                continue
+            selected.append(index)
+        return selected
+
+    def remove_many(self, indices):
+        """Удалить рыб по индексам за один проход, вернуть удалённых"""
+        removed = set(indices)
+        fishes = [self[index] for index in sorted(removed)]
+        keep = [index for index in range(len(self._flags)) if index not in removed]
+        for column in self._columns():
+            column[:] = array(column.typecode, [column[index] for index in keep])
+        if self._odd is not None:
+            self._odd = [self._odd[index] for index in keep]
+        return fishes
+
+    def to_list(self):
+        return [fish.to_dict() for fish in self]
+
+
+class EquippedItem:
+    """Предмет в слоте или в инвентаре"""
+    __slots__ = ("item_id", "durability", "effect", "extra")
+
+    def __init__(self, item_id, durability=None, effect=None, extra=None):
+        self.item_id = item_id
+        self.durability = durability
+        self.effect = effect
+        self.extra = extra
+
+    @property
+    def name(self):
+        return item_names.name(self.item_id)
+
+    @classmethod
+    def from_dict(cls, data, catalog=None):
+        data = dict(data)
+        item_id = item_names.id(data.pop("name"))
+        durability = data.pop("durability", None)
+        effect = data.pop("effect", None)
+        # Эффект совпадает с каталогом - храним ссылку на общий словарь
+        if catalog is not None and effect is not None:
+            info = catalog.get(item_names.name(item_id))
+            if info is not None and info["effect"] == effect:
+                effect = info["effect"]
+        return cls(item_id, durability, effect, data or None)
+
+    def to_dict(self):
+        data = {"name": item_names.name(self.item_id)}
+        if self.durability is not None:
+            data["durability"] = self.durability
+        if self.effect is not None:
+            data["effect"] = self.effect
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def _item_from_dict(data, catalog):
+    return EquippedItem.from_dict(data, catalog) if data else data
+
+
+def _item_to_dict(item):
+    return item.to_dict() if isinstance(item, EquippedItem) else item
+
+
+class Player:
+    """Игрок. Отсутствующие в исходной записи поля хранятся как None"""
+    __slots__ = (
+        "name", "worms", "money", "catch", "last_catch", "achievements",
+        "bag_limit", "inventory", "items", "created_at", "last_active", "extra",
+        # Служебные поля, не сохраняются
+        "bonuses", "versions",
+    )
+
+    def __init__(self, name, worms=10, money=0):
+        self.name = name
+        self.worms = worms
+        self.money = money
+        self.catch = CatchList()
+        self.last_catch = None
+        self.achievements = {}  # упорядоченное множество id достижений
+        self.bag_limit = None
+        self.inventory = None
+        self.items = None
+        self.created_at = None
+        self.last_active = None
+        self.extra = None
+        self.bonuses = None
+        self.versions = None  # версия каждой секции состояния (для дельта-синхронизации)
+
+    @property
+    def effective_bag_limit(self):
+        return self.bag_limit if self.bag_limit is not None else 20
+
+    @classmethod
+    def from_dict(cls, data, catalog=None):
+        data = dict(data)
+        player = cls(data.pop("name"), data.pop("worms"), data.pop("money"))
+        player.catch = CatchList.from_list(data.pop("catch", []), data.pop("next_fish_id", 1))
+
+        last_catch = data.pop("last_catch", None)
+        player.last_catch = Fish.from_dict(last_catch) if last_catch else last_catch
+
+        achievements = data.pop("achievements", None)
+        player.achievements = dict.fromkeys(achievements) if achievements is not None else None
+
+        player.bag_limit = data.pop("bag_limit", None)
+
+        inventory = data.pop("inventory", None)
+        if inventory is not None:
+            player.inventory = [_item_from_dict(item, catalog) for item in inventory]
+
+        items = data.pop("items", None)
+        if items is not None:
+            player.items = {slot: _item_from_dict(item, catalog) for slot, item in items.items()}
+
+        player.created_at = parse_time(data.pop("created_at", None))
+        player.last_active = parse_time(data.pop("last_active", None))
+        player.extra = data or None
+        return player
+
+    def to_dict(self):
+        data = {
+            "name": self.name,
+            "worms": self.worms,
+            "money": self.money,
+            "catch": self.catch.to_list(),
+            "last_catch": self.last_catch.to_dict() if isinstance(self.last_catch, Fish) else self.last_catch,
+        }
+        if self.catch.next_id > 1:
+            data["next_fish_id"] = self.catch.next_id
+        if self.achievements is not None:
+            data["achievements"] = list(self.achievements)
+        if self.bag_limit is not None:
+            data["bag_limit"] = self.bag_limit
+        if self.inventory is not None:
+            data["inventory"] = [_item_to_dict(item) for item in self.inventory]
+        if self.items is not None:
+            data["items"] = {slot: _item_to_dict(item) for slot, item in self.items.items()}
+        if self.created_at is not None:
+            data["created_at"] = format_time(self.created_at)
+        if self.last_active is not None:
+            data["last_active"] = format_time(self.last_active)
+        if self.extra:
+            data.update(self.extra)
+        return data
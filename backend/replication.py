@@ -0,0 +1,180 @@
+# backend/replication.py
+"""Реплики только для чтения, которые догоняют основной процесс по журналу изменений.
+
+Основной процесс после каждой записи игроков в хранилище добавляет их
+состояния в ChangeLog - кольцо последних REPLICATION_BACKLOG изменений,
+пронумерованных по порядку. ReplicationServer раздаёт журнал по unix-сокету:
+реплика присылает номер последнего применённого изменения и получает всё,
+что было после него, затем новые изменения по мере появления и пульс раз в
+REPLICATION_HEARTBEAT секунд. Если реплика отстала сильнее, чем помнит
+кольцо, или основной процесс перезапустился, она получает полную копию
+игроков из хранилища и продолжает с номера, на котором копия началась.
+
+Вместе с состоянием игрока идут версии его секций у основного процесса:
+реплика ставит их как есть, поэтому since, полученный у реплики, можно
+передать основному процессу и наоборот.
+
+Отставание реплики - сколько секунд назад она в последний раз точно
+совпадала с основным процессом (применила всё, о чём он сообщил).
+"""
+import itertools
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+from sharding import recv_message, send_message
+
+REPLICATION_BACKLOG = int(os.environ.get("REPLICATION_BACKLOG", "10000"))  # изменений в кольце основного процесса
+REPLICATION_HEARTBEAT = float(os.environ.get("REPLICATION_HEARTBEAT", "1"))  # секунды между пульсами без изменений
+REPLICATION_SNAPSHOT_CHUNK = 500  # игроков в одном сообщении полной копии
+
+
+class ChangeLog:
+    """Кольцо последних изменений игроков основного процесса"""
+
+    def __init__(self, backlog=REPLICATION_BACKLOG):
+        self.epoch = uuid.uuid4().hex  # новый при каждом запуске: номера прошлого запуска не подходят
+        self.head = 0
+        self._entries = deque(maxlen=backlog)  # [номер, user_id, user, версии секций]
+        self._changed = threading.Condition(threading.Lock())
+
+    def append(self, records):
+        """Добавить записанные в хранилище состояния [(user_id, user, версии секций)]"""
+        if not records:
+            return
+        with self._changed:
+            for user_id, user, versions in records:
+                self.head += 1
+                self._entries.append([self.head, user_id, user, versions])
+            self._changed.notify_all()
+
+    def read(self, seq, timeout):
+        """(изменения после seq, номер последнего) - ждёт новых не дольше timeout.
+
+        None, если кольцо уже не помнит изменений сразу после seq.
+        """
+        with self._changed:
+            if seq == self.head:
+                self._changed.wait(timeout)
+            first = self.head - len(self._entries) + 1
+            if seq > self.head or seq + 1 < first:
+                return None
+            return list(itertools.islice(self._entries, seq + 1 - first, None)), self.head
+
+
+class ReplicationServer:
+    """Раздача журнала изменений репликам, поток на реплику"""
+
+    def __init__(self, changes, snapshot):
+        self.changes = changes
+        self.snapshot = snapshot  # -> (user_id, user, версии секций) всех игроков
+
+    def start(self, address):
+        if os.path.exists(address):
+            os.remove(address)  # сокет прошлого запуска
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+        listener.listen(16)
+        threading.Thread(target=self._accept_loop, args=(listener,), name="replication", daemon=True).start()
+
+    def _accept_loop(self, listener):
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=self._serve_replica, args=(conn,), daemon=True).start()
+
+    def _serve_replica(self, conn):
+        try:
+            hello = recv_message(conn)
+            seq = hello.get("seq", 0) if hello.get("epoch") == self.changes.epoch else None
+            while True:
+                batch = self.changes.read(seq, REPLICATION_HEARTBEAT) if seq is not None else None
+                if batch is None:
+                    seq = self._send_snapshot(conn)
+                    continue
+                entries, head = batch
+                send_message(conn, {"entries": entries, "head": head, "time": time.time()})
+                if entries:
+                    seq = entries[-1][0]
+        except OSError:
+            pass  # реплика отключилась
+        except Exception as e:
+            print(f"Ошибка репликации: {e}")
+        finally:
+            conn.close()
+
+    def _send_snapshot(self, conn):
+        """Полная копия игроков; изменения после её начала придут из журнала"""
+        head = self.changes.head
+        send_message(conn, {"reset": True, "epoch": self.changes.epoch})
+        records = []
+        for user_id, user, versions in self.snapshot():
+            records.append([user_id, user, versions])
+            if len(records) >= REPLICATION_SNAPSHOT_CHUNK:
+                send_message(conn, {"records": records})
+                records = []
+        send_message(conn, {"records": records, "head": head, "time": time.time()})
+        return head
+
+
+class ReplicaTailer:
+    """Поток реплики: держит соединение с основным процессом и применяет изменения"""
+
+    def __init__(self, address, apply, reset):
+        self.address = address
+        self.apply = apply  # (user_id, user, версии секций) - новое состояние игрока
+        self.reset = reset  # перед полной копией
+        self.epoch = None
+        self.seq = 0
+        self.caught_up_at = None  # время основного процесса, когда реплика с ним совпадала
+
+    def start(self):
+        threading.Thread(target=self._run, name="replica-tail", daemon=True).start()
+
+    def staleness(self):
+        """Секунды с момента последнего совпадения с основным процессом (None - ещё не совпадала)"""
+        caught_up_at = self.caught_up_at
+        return None if caught_up_at is None else max(time.time() - caught_up_at, 0.0)
+
+    def _run(self):
+        while True:
+            try:
+                self._follow()
+            except OSError as e:
+                print(f"Реплика потеряла основной процесс {self.address}: {e}")
+            except Exception as e:
+                print(f"Ошибка применения журнала изменений: {e}")
+                self.epoch = None  # следующее подключение начнём с полной копии
+            time.sleep(1)
+
+    def _follow(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # Без пульса дольше нескольких интервалов основной процесс считаем зависшим
+            sock.settimeout(REPLICATION_HEARTBEAT * 5 + 5)
+            sock.connect(self.address)
+            send_message(sock, {"epoch": self.epoch, "seq": self.seq})
+            epoch = None
+            while True:
+                message = recv_message(sock)
+                if message.get("reset"):
+                    self.caught_up_at = None
+                    self.epoch = None  # копия получена не целиком - при обрыве начнём заново
+                    epoch = message["epoch"]
+                    self.reset()
+                    continue
+                for user_id, user, versions in message.get("records", ()):
+                    self.apply(user_id, user, versions)
+                for seq, user_id, user, versions in message.get("entries", ()):
+                    self.apply(user_id, user, versions)
+                    self.seq = seq
+                if "head" in message:
+                    if "records" in message:
+                        # Конец полной копии: дальше - журнал с её начального номера
+                        self.epoch, self.seq = epoch, message["head"]
+                    if self.seq >= message["head"]:
+                        self.caught_up_at = message["time"]
+        finally:
+            sock.close()
@@ -0,0 +1,88 @@
+# backend/residency.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResidentUsers:
+    """Рабочий набор игроков в памяти в порядке последнего обращения (LRU).
+
+    Сам набор никого не выгружает: он только помнит порядок и время
+    обращений, а решение о выгрузке принимает игра - ей нужно взять
+    блокировку игрока и убедиться, что он уже сохранён.
+    """
+
+    def __init__(self, capacity=0):
+        self.capacity = capacity  # 0 - без ограничения
+        self._users = OrderedDict()  # user_id -> Player, в начале - давно не нужные
+        self._accessed = {}  # user_id -> time.monotonic() последнего обращения
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def __iter__(self):
+        return iter(list(self._users))
+
+    def __getitem__(self, user_id):
+        return self._users[user_id]
+
+    def __setitem__(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = user
+            self._users.move_to_end(user_id)
+            self._accessed[user_id] = time.monotonic()
+
+    def get(self, user_id):
+        """Игрок без отметки об обращении"""
+        return self._users.get(user_id)
+
+    def touch(self, user_id):
+        """Игрок с отметкой об обращении (или None)"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                self._users.move_to_end(user_id)
+                self._accessed[user_id] = time.monotonic()
+            return user
+
+    def pop(self, user_id):
+        with self._lock:
+            self._accessed.pop(user_id, None)
+            return self._users.pop(user_id, None)
+
+    def keys(self):
+        return list(self._users)
+
+    def values(self):
+        return list(self._users.values())
+
+    def items(self):
+        return list(self._users.items())
+
+    def over_capacity(self):
+        return len(self._users) - self.capacity if self.capacity > 0 else 0
+
+    def oldest(self, limit):
+        """До limit давно не нужных игроков, начиная с самого старого"""
+        with self._lock:
+            result = []
+            for user_id in self._users:
+                if len(result) >= limit:
+                    break
+                result.append(user_id)
+            return result
+
+    def idle(self, seconds):
+        """Игроки, к которым не обращались дольше seconds секунд"""
+        cutoff = time.monotonic() - seconds
+        with self._lock:
+            result = []
+            for user_id in self._users:
+                if self._accessed.get(user_id, 0) > cutoff:
+                    break
+                result.append(user_id)
+            return result
@@ -0,0 +1,378 @@
+# backend/sharding.py
+"""Игроки, разделённые между процессами-шардами.
+
+Игрок живёт в шарде crc32(user_id) % SHARDS: только этот процесс держит
+его в памяти и пишет его файлы (users.shardK.json). Веб-воркеры состояния
+не хранят - ShardedGame повторяет интерфейс FishingGame и пересылает
+вызов шарду-владельцу по unix-сокету. Общие чтения (топ, место в топе,
+число игроков, метрики) собираются со всех шардов.
+"""
+import atexit
+import heapq
+import itertools
+import json
+import os
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+from analytics import merge_reports
+from metrics import registry
+
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT", "30"))  # секунды на ответ шарда
+SHARD_START_TIMEOUT = float(os.environ.get("SHARD_START_TIMEOUT", "300"))  # ожидание загрузки шардов
+SHARD_POOL_SIZE = int(os.environ.get("SHARD_POOL_SIZE", "32"))  # свободных соединений на шард в воркере
+
+# Методы игрока: выполняет шард-владелец, user_id - первый аргумент
+USER_METHODS = (
+    "register_user", "get_user_state", "fish", "fish_batch", "sell_fish", "keep_fish",
+    "sell_fish_from_podsak", "sell_bulk", "buy_item", "buy_worms", "buy_bag_extension",
+    "unequip_item", "equip_item", "run_batch", "get_player_rank", "get_achievements",
+)
+# Методы шарда целиком
+SHARD_METHODS = ("count_users", "stats", "top_entries", "count_ahead", "get_shop_items", "get_spots",
+                 "get_loadouts", "get_stats")
+
+_HEADER = struct.Struct("!I")
+
+
+class ShardError(RuntimeError):
+    """Шард не смог выполнить вызов"""
+
+
+def shard_of(user_id, count):
+    """Номер шарда игрока (в отличие от hash() одинаков во всех процессах)"""
+    return zlib.crc32(str(user_id).encode("utf-8")) % count
+
+
+def shard_address(shard):
+    return os.path.join(os.environ["SHARD_SOCKET_DIR"], f"shard{shard}.sock")
+
+
+def send_message(sock, message):
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    size, = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Соединение с шардом закрыто")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+# Запуск и остановка процессов шардов
+
+_processes = []
+_owner_pid = None
+
+
+def start_shards(count):
+    """Запустить процессы шардов, если их ещё не запустил этот процесс или его родитель.
+
+    Под gunicorn это делает мастер до форка воркеров, воркеры получают
+    каталог сокетов через окружение и только подключаются.
+    """
+    global _owner_pid
+    if os.environ.get("SHARD_SOCKET_DIR"):
+        return
+    import game_logic
+
+    game_logic.seed_shards(count)  # до запуска: общий файл читает только этот процесс
+    socket_dir = tempfile.mkdtemp(prefix="fishing-shards-")
+    os.environ["SHARD_SOCKET_DIR"] = socket_dir
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    python_path = os.pathsep.join(filter(None, [backend_dir, os.environ.get("PYTHONPATH")]))
+    for shard in range(count):
+        env = dict(os.environ, SHARD_INDEX=str(shard), SHARDS=str(count), PYTHONPATH=python_path)
+        _processes.append(subprocess.Popen([sys.executable, "-c", "import sharding; sharding.serve()"], env=env))
+    _owner_pid = os.getpid()
+    atexit.register(stop_shards)
+
+
+def stop_shards():
+    """Остановить шарды: по SIGTERM каждый дописывает изменения игроков и выходит"""
+    if os.getpid() != _owner_pid:
+        return  # форкнутый воркер унаследовал atexit, но шарды не его
+    for process in _processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in _processes:
+        try:
+            process.wait(SHARD_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print(f"Шард {process.pid} не остановился за {SHARD_TIMEOUT} с")
+            process.kill()
+    _processes.clear()
+    shutil.rmtree(os.environ.pop("SHARD_SOCKET_DIR", ""), ignore_errors=True)
+
+
+def serve():
+    """Точка входа процесса шарда"""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    import game_logic
+
+    # Первое обращение к game_instance создаёт FishingGame шарда и загружает игроков
+    ShardServer(game_logic.game_instance).serve_forever(shard_address(int(os.environ["SHARD_INDEX"])))
+
+
+class ShardServer:
+    """Выполнение вызовов веб-воркеров над игрой шарда, поток на соединение"""
+
+    def __init__(self, game):
+        self.game = game
+        self.methods = {name: getattr(game, name) for name in USER_METHODS + SHARD_METHODS}
+        self.methods["render_metrics"] = registry.render
+
+    def serve_forever(self, address):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Сокет появляется после загрузки игроков - его наличие и есть готовность шарда
+        listener.bind(address)
+        listener.listen(128)
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        subscription = None
+        try:
+            while True:
+                request = recv_message(conn)
+                method = request["method"]
+                if method == "subscribe":
+                    # Соединение становится потоком событий одного игрока
+                    subscription = self.game.events.subscribe(str(request["args"][0]))
+                    send_message(conn, {"result": subscription is not None})
+                elif method == "drain" and subscription is not None:
+                    send_message(conn, {"result": subscription.drain(request["args"][0])})
+                else:
+                    send_message(conn, self._call(method, request.get("args", []), request.get("kwargs", {})))
+        except OSError:
+            pass  # воркер закрыл соединение
+        finally:
+            if subscription is not None:
+                self.game.events.unsubscribe(subscription)
+            conn.close()
+
+    def _call(self, method, args, kwargs):
+        fn = self.methods.get(method)
+        if fn is None:
+            return {"error": f"Неизвестный метод: {method}"}
+        try:
+            return {"result": fn(*args, **kwargs)}
+        except Exception as e:
+            print(f"Ошибка вызова {method} в шарде: {e}")
+            return {"error": str(e)}
+
+
+# Сторона веб-воркера
+
+class ShardClient:
+    """Пул соединений воркера с одним шардом"""
+
+    def __init__(self, address):
+        self.address = address
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def connect(self, timeout=SHARD_TIMEOUT):
+        """Новое соединение; пока шард загружается, ждёт не дольше timeout секунд"""
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.address)
+                sock.settimeout(SHARD_TIMEOUT)
+                return sock
+            except OSError:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    def call(self, method, *args, **kwargs):
+        with self._lock:
+            sock = self._idle.pop() if self._idle else None
+        if sock is None:
+            sock = self.connect()
+        try:
+            send_message(sock, {"method": method, "args": args, "kwargs": kwargs})
+            reply = recv_message(sock)
+        except Exception:
+            sock.close()
+            raise
+        with self._lock:
+            if len(self._idle) < SHARD_POOL_SIZE:
+                self._idle.append(sock)
+                sock = None
+        if sock is not None:
+            sock.close()
+
+        if "error" in reply:
+            raise ShardError(reply["error"])
+        return reply["result"]
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock in idle:
+            sock.close()
+
+
+class RemoteSubscription:
+    """Подписка на события игрока в его шарде (интерфейс как у Subscription)"""
+
+    def __init__(self, user_id, sock):
+        self.user_id = user_id
+        self.closed = False
+        self._sock = sock
+
+    def drain(self, timeout):
+        try:
+            self._sock.settimeout(timeout + SHARD_TIMEOUT)
+            send_message(self._sock, {"method": "drain", "args": [timeout]})
+            return recv_message(self._sock)["result"]
+        except OSError:
+            self.close()
+            return []
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._sock.close()
+
+
+class ShardEvents:
+    """Подписки /api/stream воркера; события приходят из шардов игроков"""
+
+    def __init__(self, game):
+        self.game = game
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Новая подписка или None, если в шарде слишком много подписчиков"""
+        sock = self.game.client_for(user_id).connect()
+        try:
+            send_message(sock, {"method": "subscribe", "args": [user_id]})
+            accepted = recv_message(sock)["result"]
+        except Exception:
+            sock.close()
+            raise
+        if not accepted:
+            sock.close()
+            return None
+        subscription = RemoteSubscription(user_id, sock)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscriber_count(self):
+        return len(self._subscriptions)
+
+
+class ShardedGame:
+    """FishingGame для веб-воркера: вызовы игрока уходят в его шард"""
+
+    def __init__(self, count):
+        self.count = count
+        self.clients = [ShardClient(shard_address(shard)) for shard in range(count)]
+        self.events = ShardEvents(self)
+        for client in self.clients:
+            client.connect(SHARD_START_TIMEOUT).close()
+        registry.add_source(self._shard_metrics)
+
+    def client_for(self, user_id):
+        return self.clients[shard_of(user_id, self.count)]
+
+    def _gather(self, method, *args):
+        return [client.call(method, *args) for client in self.clients]
+
+    def _shard_metrics(self):
+        return self._gather("render_metrics")
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+    def count_users(self):
+        return sum(self._gather("count_users"))
+
+    def stats(self):
+        totals = {}
+        for stats in self._gather("stats"):
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def get_shop_items(self):
+        return self.clients[0].call("get_shop_items")
+
+    def get_spots(self):
+        return self.clients[0].call("get_spots")
+
+    def get_loadouts(self, spot=None, limit=20, sort="profit"):
+        return self.clients[0].call("get_loadouts", spot, limit, sort)
+
+    def get_stats(self, hours=24):
+        """Итоги аналитики всех шардов"""
+        return merge_reports(self._gather("get_stats", hours))
+
+    def get_top_players(self, limit=10):
+        """Общий топ: слияние топов шардов, каждый уже отсортирован"""
+        entries = heapq.merge(*self._gather("top_entries", limit),
+                              key=lambda entry: (-entry["money"], entry["user_id"]))
+        return [
+            {
+                "rank": i,
+                "name": entry["name"],
+                "money": entry["money"],
+                "achievements_count": entry["achievements_count"]
+            }
+            for i, entry in enumerate(itertools.islice(entries, limit), 1)
+        ]
+
+    def get_player_rank(self, user_id):
+        """Место в своём шарде плюс игроки выше в остальных"""
+        owner = shard_of(user_id, self.count)
+        result = self.clients[owner].call("get_player_rank", user_id)
+        if "error" in result or result["rank"] is None:
+            return result
+        for shard, client in enumerate(self.clients):
+            if shard != owner:
+                result["rank"] += client.call("count_ahead", result["money"], str(user_id))
+        result["total_players"] = self.count_users()
+        return result
+
+
+def _routed(name):
+    def method(self, user_id=None, *args, **kwargs):
+        return self.client_for(user_id).call(name, user_id, *args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+for _name in USER_METHODS:
+    if not hasattr(ShardedGame, _name):
+        setattr(ShardedGame, _name, _routed(_name))
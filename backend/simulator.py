@@ -0,0 +1,162 @@
+# backend/simulator.py
+"""Векторный симулятор забросов на NumPy.
+
+Повторяет распределения FishingGame._roll_catch / _generate_weight для
+одного места рыбалки, но разыгрывает тысячи забросов разом. Используется
+для пакетной рыбалки и для офлайн-расчётов экономики:
+
+    python simulator.py --casts 10000000 --seed 1 --item "Блесна легенд" --spot pond
+"""
+import argparse
+import json
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость
+    np = None
+
+
+def available():
+    return np is not None
+
+
+def make_rng(seed=None):
+    return np.random.default_rng(seed)
+
+
+class CastSimulator:
+    """Векторный розыгрыш забросов на месте рыбалки (catalog.Spot).
+
+    Индексы видов совпадают с spot.species, вид выбирается той же таблицей
+    псевдонимов. Пустой заброс имеет индекс -1.
+    """
+
+    def __init__(self, spot):
+        if np is None:
+            raise RuntimeError("Для симулятора нужен numpy")
+        species = spot.species
+        self.species = [fish.name for fish in species]
+        self.species_types = [fish.type for fish in species]
+        self.base_chance = spot.base_chance
+
+        self.prob = np.array(spot.table.prob)
+        self.alias = np.array(spot.table.alias)
+        self.min_weight = np.array([fish.min_weight for fish in species])
+        self.max_weight = np.array([fish.max_weight for fish in species])
+        self.price_per_kg = np.array([fish.price_per_kg for fish in species], dtype=float)
+        self.golden = np.array([fish.golden for fish in species])
+        self.trophy_chance = np.array([fish.trophy_chance for fish in species])
+        self.trophy_scale = np.array([fish.trophy_scale for fish in species])
+        self.trophy_cap = np.array([fish.trophy_cap for fish in species])
+
+    def simulate(self, n, bonuses, rng=None):
+        """Разыграть n забросов с заданными бонусами.
+
+        Возвращает словарь массивов длины n: success (bool), species,
+        weight (кг), price (руб.) и trophy (bool).
+        """
+        rng = rng if rng is not None else make_rng()
+
+        success = rng.random(n) < self.base_chance + bonuses.chance_bonus
+        species = rng.integers(0, len(self.prob), size=n)
+        species = np.where(rng.random(n) < self.prob[species], species, self.alias[species])
+
+        weight = np.round(rng.uniform(self.min_weight[species], self.max_weight[species]), 2)
+
+        # Трофейный хвост сверх max_weight у видов с trophy_chance
+        chance = self.trophy_chance[species]
+        trophy = (chance > 0) & (rng.random(n) < chance + bonuses.rare_weight_bonus)
+        tail = np.minimum(rng.exponential(1.0, size=n) * self.trophy_scale[species], self.trophy_cap[species])
+        weight = np.where(trophy, np.round(self.max_weight[species] + 0.01 + tail, 2), weight)
+
+        price = (weight * self.price_per_kg[species] * bonuses.price_multiplier).astype(np.int64)
+
+        return {
+            "success": success,
+            "species": np.where(success, species, -1),
+            "weight": np.where(success, weight, 0.0),
+            "price": np.where(success, price, 0),
+            "trophy": success & trophy,
+        }
+
+    def unique_catches(self, batch):
+        """Уникальные уловы серии: [(fish, количество)] без пустых забросов"""
+        success = batch["success"]
+        rows = np.column_stack((
+            batch["species"][success].astype(float),
+            batch["weight"][success],
+            batch["price"][success].astype(float),
+        ))
+        if not len(rows):
+            return []
+
+        uniques, counts = np.unique(rows, axis=0, return_counts=True)
+        catches = []
+        for (species, weight, price), count in zip(uniques.tolist(), counts.tolist()):
+            species = int(species)
+            fish = {
+                "name": self.species[species],
+                "weight": weight,
+                "price": int(price),
+                "type": self.species_types[species],
+            }
+            if self.golden[species]:
+                fish["is_golden"] = True
+            catches.append((fish, count))
+        return catches
+
+    def economy(self, casts, bonuses, seed=None, chunk=1_000_000):
+        """Статистика экономики по большой серии забросов (считается кусками)"""
+        rng = make_rng(seed)
+        size = len(self.species)
+        counts = np.zeros(size, dtype=np.int64)
+        values = np.zeros(size, dtype=np.int64)
+        caught = 0
+        trophies = 0
+        max_weight = 0.0
+
+        left = casts
+        while left > 0:
+            n = min(chunk, left)
+            batch = self.simulate(n, bonuses, rng)
+            species = batch["species"][batch["success"]]
+            counts += np.bincount(species, minlength=size)
+            values += np.bincount(species, weights=batch["price"][batch["success"]], minlength=size).astype(np.int64)
+            caught += len(species)
+            trophies += int(batch["trophy"].sum())
+            max_weight = max(max_weight, float(batch["weight"].max()))
+            left -= n
+
+        total_value = int(values.sum())
+        return {
+            "casts": casts,
+            "caught": caught,
+            "catch_rate": caught / casts if casts else 0.0,
+            "total_value": total_value,
+            "value_per_cast": total_value / casts if casts else 0.0,
+            "trophies": trophies,
+            "max_weight": max_weight,
+            "species": {
+                self.species[i]: {"count": int(counts[i]), "value": int(values[i])}
+                for i in range(size)
+            },
+        }
+
+
+def main():
+    from game_logic import all_items, calculate_bonuses, create_simulator
+
+    parser = argparse.ArgumentParser(description="Офлайн-симуляция экономики рыбалки")
+    parser.add_argument("--casts", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--item", action="append", default=[], help="надетый предмет (можно несколько)")
+    parser.add_argument("--spot", default=None, help="место рыбалки из catalog.json (по умолчанию - основное)")
+    args = parser.parse_args()
+
+    bonuses = calculate_bonuses(all_items[name]["effect"] for name in args.item)
+    stats = create_simulator(args.spot).economy(args.casts, bonuses, seed=args.seed)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,693 @@
+# backend/storage.py
+import json
+import mmap
+import os
+import re
+import sqlite3
+import threading
+
+from metrics import SNAPSHOT_BYTES
+
+
+class Storage:
+    """Интерфейс хранилища игроков.
+
+    Хранилище работает с записями игроков как с обычными JSON-словарями,
+    ключ - строковый user_id.
+    """
+
+    def load_all(self):
+        """Все игроки: {user_id: user}"""
+        raise NotImplementedError
+
+    def open(self):
+        """Подготовка к чтению игроков по одному (вместо load_all)"""
+
+    def scan_money(self):
+        """(user_id, money) всех игроков - для рейтинга без загрузки записей"""
+        for user_id, user in self.load_all().items():
+            yield user_id, user.get("money", 0)
+
+    def get(self, user_id):
+        """Запись одного игрока или None"""
+        raise NotImplementedError
+
+    def iter_records(self):
+        """(user_id, user) всех игроков по одному - для выгрузки без остановки сервера"""
+        return iter(self.load_all().items())
+
+    def put(self, user_id, user):
+        """Сохранить запись одного игрока"""
+        raise NotImplementedError
+
+    def put_many(self, records):
+        """Сохранить несколько игроков: [(user_id, user)]"""
+        return all([self.put(user_id, user) for user_id, user in records])
+
+    def update(self, user_id, fn):
+        """Прочитать игрока, применить к нему fn и сохранить результат"""
+        user = self.get(user_id)
+        if user is None:
+            return None
+        fn(user)
+        self.put(user_id, user)
+        return user
+
+    def count(self):
+        """Количество игроков"""
+        raise NotImplementedError
+
+    def checkpoint(self):
+        """Довести данные до долговременного состояния"""
+        return True
+
+    def close(self):
+        pass
+
+
+def _dump_record(user_id, user):
+    """Компактная сериализация одной записи журнала"""
+    return json.dumps({"id": user_id, "user": user}, ensure_ascii=False, separators=(",", ":"))
+
+
+def _replay_log(path, users):
+    """Применение журнала к словарю пользователей"""
+    if not os.path.exists(path):
+        return 0
+
+    applied = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Оборванная последняя запись после падения - пропускаем
+                print(f"Пропущена повреждённая запись журнала {path}")
+                continue
+            users[record["id"]] = record["user"]
+            applied += 1
+    return applied
+
+
+# Структурные токены JSON: строки целиком и скобки (числа и литералы пропускаются)
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+_COLON = re.compile(rb'\s*:\s*')
+_MONEY = re.compile(rb'\s*:\s*(-?\d+)\s*[,}]')
+
+
+def index_snapshot(data):
+    """Байтовые смещения игроков в снапшоте: {user_id: [начало, конец, деньги]}"""
+    return {user_id: [start, end, money] for user_id, start, end, money in iter_snapshot(data)}
+
+
+def iter_snapshot(data):
+    """(user_id, начало, конец, деньги) каждого игрока снапшота по порядку.
+
+    Снапшот - один JSON-объект {user_id: запись}. Сканер идёт по строкам и
+    скобкам, не разбирая записи, и попутно достаёт деньги игрока для рейтинга.
+    """
+    depth = 0
+    user_id = start = money = None
+    for match in _TOKEN.finditer(data):
+        token = match.group()
+        first = token[:1]
+        if first == b'"':
+            if depth == 1:
+                user_id = json.loads(token)
+                start = _COLON.match(data, match.end()).end()
+                if data[start:start + 1] != b"{":
+                    raise ValueError(f"Запись игрока {user_id} - не объект")
+                money = None
+            elif depth == 2 and token == b'"money"':
+                found = _MONEY.match(data, match.end())
+                if found:
+                    money = int(found.group(1))
+        elif first in b"{[":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1 and user_id is not None:
+                yield user_id, start, match.end(), money or 0
+                user_id = None
+
+
+def _scan_log(path):
+    """Последняя строка журнала каждого игрока (без разбора записей) и число записей"""
+    if not os.path.exists(path):
+        return {}, 0
+    with open(path, "r", encoding="utf-8") as f:
+        return _scan_lines(f, path)
+
+
+def _scan_lines(f, path):
+    lines = {}
+    count = 0
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            user_id = json.loads(line)["id"]
+        except ValueError:
+            print(f"Пропущена повреждённая запись журнала {path}")
+            continue
+        lines[user_id] = line
+        count += 1
+    return lines, count
+
+
+def _complete_lines(f):
+    """Строки журнала, открытого в двоичном режиме; незаконченная последняя -
+    запись, которую сервер дописывает прямо сейчас, - отбрасывается"""
+    for line in f:
+        if not line.endswith(b"\n"):
+            break
+        yield line.decode("utf-8")
+
+
+def _file_id(f):
+    if f is None:
+        return None
+    stat = os.fstat(f.fileno())
+    return stat.st_dev, stat.st_ino
+
+
+def _path_id(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def _open_existing(path):
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+
+class WalStorage(Storage):
+    """Хранилище: снапшот users.json + журнал изменений (write-ahead log).
+
+    Каждое действие дописывает в журнал одну компактную запись с актуальным
+    состоянием игрока, поэтому стоимость записи не зависит от числа игроков.
+    Когда журнал разрастается, он ротируется и в фоне сливается со снапшотом.
+    Сами записи хранилище в памяти не держит (это делает игра).
+
+    В ленивом режиме (open() вместо load_all()) снапшот отображается в память
+    через mmap, а байтовые смещения игроков лежат в индексе users.json.idx.
+    Игрок читается по смещению только когда он нужен; свежие записи журнала
+    хранятся строками до слияния в снапшот. get() и scan_money() работают
+    только в ленивом режиме: без индекса каждый вызов перечитывал бы всё
+    хранилище под блокировкой.
+    """
+
+    def __init__(self, snapshot_path, fsync_interval=1.0, compact_every=5000):
+        self.snapshot_path = snapshot_path
+        self.log_path = snapshot_path + ".wal"
+        self.old_log_path = self.log_path + ".old"
+        self.index_path = snapshot_path + ".idx"
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+
+        self._ids = set()
+        self._lock = threading.Lock()
+        self._log = None
+        self._records = 0
+        self._unsynced = False
+        self._compactor = None
+        self._closed = threading.Event()
+        self._sync_thread = None
+
+        # Ленивый режим
+        self._index = None  # {user_id: [начало, конец, деньги]} в снапшоте
+        self._snapshot_map = None
+        self._recent = {}  # user_id -> строка текущего журнала
+        self._rotated = {}  # user_id -> строка журнала, который сливается в снапшот
+
+    def load_all(self):
+        """Загрузка снапшота и воспроизведение хвоста журнала"""
+        users = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    users = json.load(f)
+            except Exception as e:
+                print(f"Ошибка загрузки снапшота: {e}")
+                users = {}
+
+        _replay_log(self.old_log_path, users)
+        self._records = _replay_log(self.log_path, users)
+
+        self._start()
+        self._ids = set(users)
+        return users
+
+    def open(self):
+        """Ленивое открытие: индекс снапшота и строки журнала, без разбора записей"""
+        self._snapshot_map, self._index = self._map_snapshot()
+        self._rotated, _ = _scan_log(self.old_log_path)
+        self._recent, self._records = _scan_log(self.log_path)
+        self._ids = set(self._index) | set(self._rotated) | set(self._recent)
+        self._start()
+        if self._rotated:
+            # Журнал, не слитый до падения, сливаем сразу
+            with self._lock:
+                self._start_compaction()
+
+    def _start(self):
+        self._open_log()
+        if self.fsync_interval > 0 and self._sync_thread is None:
+            self._sync_thread = threading.Thread(target=self._sync_loop, name="wal-fsync", daemon=True)
+            self._sync_thread.start()
+
+    def _map_snapshot(self):
+        """mmap снапшота и его индекс (из .idx, если индекс построен по этому файлу)"""
+        if not os.path.exists(self.snapshot_path) or os.path.getsize(self.snapshot_path) == 0:
+            return None, {}
+        with open(self.snapshot_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            snapshot_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index = self._read_index(stat)
+        if index is None:
+            index = index_snapshot(snapshot_map)
+            self._write_index(stat, index)
+        return snapshot_map, index
+
+    def _read_index(self, stat):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("size") != stat.st_size or saved.get("mtime_ns") != stat.st_mtime_ns:
+            return None
+        return saved["records"]
+
+    def _write_index(self, stat, index):
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "records": index},
+                          f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            print(f"Ошибка записи индекса снапшота: {e}")
+
+    def _open_log(self):
+        self._log = open(self.log_path, "a", encoding="utf-8")
+
+    def _require_index(self):
+        if self._index is None:
+            raise RuntimeError(f"{self.snapshot_path}: чтение по одному игроку без open()")
+
+    def get(self, user_id):
+        if user_id not in self._ids:
+            return None
+        self._require_index()
+
+        with self._lock:
+            line = self._recent.get(user_id) or self._rotated.get(user_id)
+            if line is None:
+                start, end, _ = self._index[user_id]
+                raw = self._snapshot_map[start:end]
+        if line is not None:
+            return json.loads(line)["user"]
+        return json.loads(raw)
+
+    def scan_money(self):
+        self._require_index()
+        with self._lock:
+            index = self._index
+            overlay = dict(self._rotated)
+            overlay.update(self._recent)
+        for user_id, line in overlay.items():
+            yield user_id, json.loads(line)["user"].get("money", 0)
+        for user_id, (_, _, money) in index.items():
+            if user_id not in overlay:
+                yield user_id, money
+
+    def count(self):
+        return len(self._ids)
+
+    def iter_records(self):
+        """Игроки по одному прямо из файлов: снапшот через mmap, журналы построчно.
+
+        Работает и из другого процесса рядом с живым сервером: блокировки
+        хранилища не берутся, а открытые файлы держат ту версию данных, что
+        была на диске в момент открытия, - ротация и слияние журнала её не
+        меняют. В памяти только строки журналов (их не больше compact_every).
+        """
+        snapshot, old_log, log = self._open_files()
+        try:
+            overlay = {}
+            for f, path in ((old_log, self.old_log_path), (log, self.log_path)):
+                if f is not None:
+                    overlay.update(_scan_lines(_complete_lines(f), path)[0])
+            if snapshot is not None and os.fstat(snapshot.fileno()).st_size > 0:
+                with mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for user_id, start, end, _ in iter_snapshot(data):
+                        if user_id not in overlay:
+                            yield user_id, json.loads(data[start:end])
+            for user_id, line in overlay.items():
+                yield user_id, json.loads(line)["user"]
+        finally:
+            for f in (snapshot, old_log, log):
+                if f is not None:
+                    f.close()
+
+    def _open_files(self):
+        """Снапшот и оба журнала одного момента времени.
+
+        Файлы открываются по очереди; если за это время журнал ротировался
+        или снапшот заменился, пути будут указывать на другие файлы - тогда
+        открываем заново.
+        """
+        paths = (self.snapshot_path, self.old_log_path, self.log_path)
+        while True:
+            files = [_open_existing(path) for path in paths]
+            if [_file_id(f) for f in files] == [_path_id(path) for path in paths]:
+                return files
+            for f in files:
+                if f is not None:
+                    f.close()
+
+    def put(self, user_id, user):
+        """Дописать состояние игрока в журнал"""
+        line = _dump_record(user_id, user) + "\n"
+        try:
+            with self._lock:
+                if self._log is None:
+                    self._open_log()
+                self._log.write(line)
+                self._log.flush()
+                if self.fsync_interval > 0:
+                    self._unsynced = True
+                else:
+                    os.fsync(self._log.fileno())
+                self._records += 1
+                self._ids.add(user_id)
+                if self._index is not None:
+                    self._recent[user_id] = line
+                if self._records >= self.compact_every:
+                    self._start_compaction()
+            return True
+        except Exception as e:
+            print(f"Ошибка записи журнала: {e}")
+            return False
+
+    def put_many(self, records):
+        """Групповая запись: все записи одним куском и один fsync"""
+        records = list(records)
+        if not records:
+            return True
+        lines = [(user_id, _dump_record(user_id, user)) for user_id, user in records]
+        chunk = "".join(line + "\n" for _, line in lines)
+        try:
+            with self._lock:
+                if self._log is None:
+                    self._open_log()
+                self._log.write(chunk)
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._unsynced = False
+                self._records += len(records)
+                self._ids.update(user_id for user_id, _ in records)
+                if self._index is not None:
+                    self._recent.update(lines)
+                if self._records >= self.compact_every:
+                    self._start_compaction()
+            return True
+        except Exception as e:
+            print(f"Ошибка записи журнала: {e}")
+            return False
+
+    def _sync_loop(self):
+        """Периодический fsync журнала: при падении теряется не больше одного окна"""
+        while not self._closed.wait(self.fsync_interval):
+            self.sync()
+
+    def sync(self):
+        with self._lock:
+            if self._log is not None and self._unsynced:
+                os.fsync(self._log.fileno())
+                self._unsynced = False
+
+    def _start_compaction(self):
+        """Ротация журнала и запуск фонового слияния (вызывается под self._lock)"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        if os.path.exists(self.old_log_path):
+            # Предыдущий журнал ещё не слит (например, после падения)
+            self._compactor = threading.Thread(target=self._compact, name="wal-compact", daemon=True)
+            self._compactor.start()
+            return
+
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._log.close()
+        os.replace(self.log_path, self.old_log_path)
+        self._open_log()
+        self._records = 0
+        self._unsynced = False
+        if self._index is not None:
+            self._rotated, self._recent = self._recent, {}
+
+        self._compactor = threading.Thread(target=self._compact, name="wal-compact", daemon=True)
+        self._compactor.start()
+
+    def _compact(self):
+        """Слияние снапшота с ротированным журналом в новый снапшот"""
+        if self._index is not None:
+            self._compact_mapped()
+            return
+        try:
+            users = {}
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    users = json.load(f)
+            _replay_log(self.old_log_path, users)
+            self._write_snapshot(users)
+            os.remove(self.old_log_path)
+        except Exception as e:
+            print(f"Ошибка компактификации журнала: {e}")
+
+    def _compact_mapped(self):
+        """Слияние в ленивом режиме: неизменённые записи копируются из mmap
+        байтами, индекс нового снапшота строится по ходу записи"""
+        try:
+            rotated = self._rotated
+            tmp_path = self.snapshot_path + ".tmp"
+            index = {}
+            with open(tmp_path, "wb") as f:
+                position = f.write(b"{")
+                merged = dict.fromkeys(self._index)
+                merged.update(dict.fromkeys(rotated))
+                for user_id in merged:
+                    line = rotated.get(user_id)
+                    if line is None:
+                        start, end, money = self._index[user_id]
+                        body = self._snapshot_map[start:end]
+                    else:
+                        user = json.loads(line)["user"]
+                        money = user.get("money", 0)
+                        body = json.dumps(user, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                    prefix = (b"," if index else b"") + json.dumps(user_id, ensure_ascii=False).encode("utf-8") + b":"
+                    position += f.write(prefix)
+                    index[user_id] = [position, position + len(body), money]
+                    position += f.write(body)
+                f.write(b"}")
+                f.flush()
+                os.fsync(f.fileno())
+            SNAPSHOT_BYTES.set(os.path.getsize(tmp_path))
+            os.replace(tmp_path, self.snapshot_path)
+
+            with open(self.snapshot_path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                snapshot_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._write_index(stat, index)
+            with self._lock:
+                old_map = self._snapshot_map
+                self._snapshot_map, self._index = snapshot_map, index
+                self._rotated = {}
+            if old_map is not None:
+                old_map.close()
+            os.remove(self.old_log_path)
+        except Exception as e:
+            print(f"Ошибка компактификации журнала: {e}")
+
+    def _write_snapshot(self, users):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(users, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        SNAPSHOT_BYTES.set(os.path.getsize(tmp_path))
+        os.replace(tmp_path, self.snapshot_path)
+
+    def checkpoint(self):
+        """Синхронная компактификация (журнал сливается в снапшот)"""
+        with self._lock:
+            self._start_compaction()
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        return not os.path.exists(self.old_log_path)
+
+    def close(self):
+        self._closed.set()
+        compactor = self._compactor
+        if compactor is not None and compactor.is_alive():
+            compactor.join()
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._log.close()
+                self._log = None
+            if self._snapshot_map is not None:
+                self._snapshot_map.close()
+                self._snapshot_map = None
+                self._index = None
+
+
+class SqliteStorage(Storage):
+    """Хранилище в SQLite (режим WAL): одна строка на игрока.
+
+    Запись игрока лежит в колонке data как компактный JSON, а имя, деньги и
+    время активности продублированы в отдельные колонки для запросов.
+    Запись одного игрока затрагивает ровно одну строку.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS players (
+            user_id     TEXT PRIMARY KEY,
+            name        TEXT,
+            money       INTEGER NOT NULL DEFAULT 0,
+            last_active TEXT,
+            data        TEXT NOT NULL
+        )
+    """
+    SQL_GET = "SELECT data FROM players WHERE user_id = ?"
+    SQL_PUT = """
+        INSERT INTO players (user_id, name, money, last_active, data) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            name = excluded.name, money = excluded.money,
+            last_active = excluded.last_active, data = excluded.data
+    """
+    SQL_ALL = "SELECT user_id, data FROM players"
+    SQL_MONEY = "SELECT user_id, money FROM players"
+    SQL_COUNT = "SELECT COUNT(*) FROM players"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(self.SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS players_money ON players (money DESC)")
+
+    def _connection(self):
+        """Соединение текущего потока (sqlite3 кеширует подготовленные запросы)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _row(user_id, user):
+        return (
+            user_id,
+            user.get("name"),
+            int(user.get("money", 0)),
+            user.get("last_active"),
+            json.dumps(user, ensure_ascii=False, separators=(",", ":")),
+        )
+
+    def load_all(self):
+        return {user_id: json.loads(data) for user_id, data in self._connection().execute(self.SQL_ALL)}
+
+    def scan_money(self):
+        return self._connection().execute(self.SQL_MONEY).fetchall()
+
+    def iter_records(self):
+        # Курсор читает строки по мере обхода; в режиме WAL запись не ждёт чтения
+        for user_id, data in self._connection().execute(self.SQL_ALL):
+            yield user_id, json.loads(data)
+
+    def get(self, user_id):
+        row = self._connection().execute(self.SQL_GET, (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, user_id, user):
+        try:
+            with self._connection() as conn:
+                conn.execute(self.SQL_PUT, self._row(user_id, user))
+            return True
+        except Exception as e:
+            print(f"Ошибка записи в SQLite: {e}")
+            return False
+
+    def put_many(self, records):
+        """Сохранить несколько игроков одной транзакцией"""
+        try:
+            with self._connection() as conn:
+                conn.executemany(self.SQL_PUT, (self._row(user_id, user) for user_id, user in records))
+            return True
+        except Exception as e:
+            print(f"Ошибка записи в SQLite: {e}")
+            return False
+
+    def update(self, user_id, fn):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(self.SQL_GET, (user_id,)).fetchone()
+            if row is None:
+                return None
+            user = json.loads(row[0])
+            fn(user)
+            conn.execute(self.SQL_PUT, self._row(user_id, user))
+        return user
+
+    def count(self):
+        return self._connection().execute(self.SQL_COUNT).fetchone()[0]
+
+    def checkpoint(self):
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+def shard_path(path, shard=None):
+    """Файл хранилища шарда: users.json -> users.shard2.json"""
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{shard}{ext}"
+
+
+def open_storage(backend, path, **options):
+    """Создание хранилища по имени бэкенда ("wal" или "sqlite")"""
+    if backend == "wal":
+        return WalStorage(path, **options)
+    if backend == "sqlite":
+        return SqliteStorage(path)
+    raise ValueError(f"Неизвестный бэкенд хранилища: {backend}")
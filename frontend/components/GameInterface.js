@@ -12,11 +12,32 @@ class GameInterface {
         await this.loadGameState();
         this.render();
         this.setupEventListeners();
+        this.subscribeToEvents();
+    }
+
+    subscribeToEvents() {
+        // Изменения, сделанные в других вкладках, приходят через SSE
+        if (!window.EventSource) return;
+        this.eventSource = new EventSource(`/api/stream?user_id=${this.telegramUser.id}`);
+        const onChange = (event) => {
+            const data = JSON.parse(event.data);
+            if (!this.gameState || event.type === 'resync' || data.version > this.gameState.version) {
+                this.loadGameState();
+            }
+        };
+        for (const type of ['catch', 'balance', 'item_broken', 'achievement', 'resync']) {
+            this.eventSource.addEventListener(type, onChange);
+        }
     }
 
     async loadGameState() {
         try {
-            const response = await fetch(`/api/game/state?user_id=${this.telegramUser.id}`);
+            // Если состояние уже есть, сервер пришлёт только изменившиеся секции
+            const since = this.gameState ? `&since=${this.gameState.version}` : '';
+            const response = await fetch(`/api/game/state?user_id=${this.telegramUser.id}${since}`);
+            if (response.status === 304) {
+                return;
+            }
             const data = await response.json();
             
             if (data.error) {
@@ -24,7 +45,7 @@ class GameInterface {
                 return;
             }
             
-            this.gameState = data;
+            this.gameState = { ...this.gameState, ...data };
             this.updateUI();
         } catch (error) {
             this.showError('Ошибка загрузки состояния игры');
@@ -190,22 +190,32 @@ class Shop {
         this.updateUI();
     }
 
+    // Покупка и новое состояние за один запрос через /api/batch
+    async runShopAction(operation) {
+        const response = await fetch('/api/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ 
+                user_id: this.telegramUser.id,
+                atomic: true,
+                operations: [operation]
+            })
+        });
+        
+        const data = await response.json();
+        
+        if (data.state) {
+            this.gameState = data.state;
+        }
+        return data.success ? data.results[0] : { error: data.error };
+    }
+
     async buyItem(itemName) {
         try {
-            const response = await fetch('/api/shop/buy', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ 
-                    user_id: this.telegramUser.id,
-                    item_name: itemName 
-                })
-            });
-            
-            const data = await response.json();
+            const data = await this.runShopAction({ op: 'buy', item_name: itemName });
             
             if (data.success) {
                 this.showNotification(`✅ Куплен предмет: ${itemName}`);
-                await this.loadGameState();
                 this.updateUI();
             } else {
                 this.showError(data.error);
@@ -217,20 +227,10 @@ class Shop {
 
     async buyWorms(count) {
         try {
-            const response = await fetch('/api/shop/buy_worms', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ 
-                    user_id: this.telegramUser.id,
-                    count: count 
-                })
-            });
-            
-            const data = await response.json();
+            const data = await this.runShopAction({ op: 'buy_worms', count: count });
             
             if (data.success) {
                 this.showNotification(`🪱 Куплено ${count} червей за ${data.cost}₽`);
-                await this.loadGameState();
                 this.updateUI();
             } else {
                 this.showError(data.error);
@@ -242,19 +242,10 @@ class Shop {
 
     async buyBagExtension() {
         try {
-            const response = await fetch('/api/shop/buy_bag', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ 
-                    user_id: this.telegramUser.id
-                })
-            });
-            
-            const data = await response.json();
+            const data = await this.runShopAction({ op: 'buy_bag' });
             
             if (data.success) {
                 this.showNotification(`🎒 Подсак расширен до ${data.new_bag_limit} мест!`);
-                await this.loadGameState();
                 this.updateUI();
             } else {
                 this.showError(data.error);